@@ -11,7 +11,7 @@
 import click
 from flask.cli import with_appcontext
 
-from .items.cli import items, libraries
+from .items import cli as items_cli
 from .users.cli import users
 
 
@@ -22,10 +22,20 @@ def circulation():
 
 @circulation.command()
 @click.argument('users_json', type=click.Path(exists=True))
+@click.option(
+    '--bulk',
+    is_flag=True,
+    help='Insert the users in batches, committing each batch.',
+    default=False)
+@click.option(
+    '--batch-size',
+    type=click.IntRange(min=1),
+    help='Number of users inserted at once in bulk mode.',
+    default=None)
 @with_appcontext
-def borrowers(users_json):
+def borrowers(users_json, bulk, batch_size):
     """Load users from JSON files and output ILS Records."""
-    users(users_json)
+    users(users_json, bulk=bulk, batch_size=batch_size)
 
 
 @circulation.command()
@@ -33,18 +43,24 @@ def borrowers(users_json):
 @with_appcontext
 def libraries(libraries_json):
     """Load libraries from JSON files and output ILS Records."""
-    libraries(libraries_json)
+    items_cli.libraries(libraries_json)
 
 
 @circulation.command()
 @click.argument('items_json_folder', type=click.Path(exists=True))
 @click.argument('locations_json', type=click.Path(exists=True))
+@click.option(
+    '--workers',
+    '-w',
+    type=click.IntRange(min=1),
+    help='Number of processes migrating the items dumps in parallel.',
+    default=1)
 @with_appcontext
-def items(items_json_folder, locations_json):
+def items(items_json_folder, locations_json, workers):
     """Load items from JSON files.
 
     :param str items_json_folder: The path to the JSON dump of the legacy items
     :param str locations_json: The path to the JSON records of the new ILS
                 libraries (already migrated)
     """
-    items(items_json_folder, locations_json)
+    items_cli.items(items_json_folder, locations_json, workers=workers)
@@ -9,8 +9,13 @@
 """CDS Migrator Circulation API."""
 
 import logging
+from collections import Counter
 from datetime import datetime
 
+from cds_migrator_kit.circulation.pids import PidRange
+from cds_migrator_kit.circulation.utils import RejectionLog, \
+    legacy_date_isoformat
+
 logger = logging.getLogger(__name__)
 
 
@@ -103,10 +108,37 @@ class ItemsMigrator():
     ITEM_STATUSES = ['LOANABLE', 'MISSING', 'IN_BINDING', 'SCANNING']
     RESTRICTIONS = ['FOR_REFERENCE_ONLY']
     MEDIUMS = ['NOT_SPECIFIED', 'ONLINE', 'PAPER', 'CDROM', 'DVD', 'VHS']
-
-    def __init__(self, items, internal_locations):
-        """Constructor."""
+    # new values of the lowercased legacy values
+    STATUSES_MAPPING = {
+        'on shelf': ITEM_STATUSES[0],
+        'on loan': ITEM_STATUSES[0],
+        'missing': ITEM_STATUSES[1],
+        'untraceable': ITEM_STATUSES[1],
+        'in binding': ITEM_STATUSES[2],
+    }
+    LOAN_PERIODS_MAPPING = {
+        'reference': RESTRICTIONS[0],
+        '4 weeks': None,
+        '1 week': None,
+    }
+
+    def __init__(self, items, internal_locations, item_pids=None,
+                 rejections=None):
+        """Constructor.
+
+        :param items: iterable of legacy items, f.e. streamed from a dump.
+        :param item_pids: ``PidRange`` of the items, by position in
+            ``items``. PIDs start from 1 if not given.
+        :param rejections: ``RejectionLog`` of the items not imported, only
+            counted if not given.
+        """
         self.items = items
+        self.item_pids = item_pids or PidRange(1, float('inf'))
+        self.rejections = rejections or RejectionLog()
+        # number of items read
+        self.total = 0
+        # number of items without a date, set to now, per field
+        self.missing_dates = Counter()
         # map of legacy library id with new PID
         self.internal_locations = dict()
         for il in internal_locations:
@@ -115,116 +147,106 @@ class ItemsMigrator():
 
     def _transform_status(self, item):
         """Return the new record status."""
-        legacy_status = item['status'].lower()
-        if legacy_status in ['on shelf', 'on loan']:
-            new_status = self.ITEM_STATUSES[0]
-        elif legacy_status in ['missing', 'untraceable']:
-            new_status = self.ITEM_STATUSES[1]
-        elif legacy_status == 'in binding':
-            new_status = self.ITEM_STATUSES[2]
-        else:
+        try:
+            return self.STATUSES_MAPPING[item['status'].lower()]
+        except KeyError:
             raise ValueError
 
-        return new_status
-
     def _transform_loan_period(self, item):
         """Return the new record circulation restriction."""
-        legacy_restriction = item['loan_period'].lower()
-        if legacy_restriction == 'reference':
-            new_restriction = self.RESTRICTIONS[0]
-        elif legacy_restriction in ['4 weeks', '1 week']:
-            new_restriction = None
-        else:
+        try:
+            return self.LOAN_PERIODS_MAPPING[item['loan_period'].lower()]
+        except KeyError:
             raise ValueError
-        return new_restriction
 
-    def _clean_date(self, legacy_date, item):
-        """Return the new record date format."""
+    def _clean_date(self, item, field):
+        """Return the new record date format.
+
+        Missing dates are set to now and counted in ``missing_dates``.
+        """
         # old: 2016-01-29T17:28:17
         # new: "2018-05-16T12:34:28.233187+00:00"
+        legacy_date = item[field]
         if not legacy_date:
-            _log = "`creation_date` or `modification_date` is None for item " \
-                   "with `barcode={barcode}`. Setting it to now().".format(
-                    barcode=item['barcode'])
-            logger.warning(_log)
-            print(_log)
-            d = datetime.now()
-        else:
-            d = datetime.strptime(legacy_date, '%Y-%m-%dT%H:%M:%S')
-        return d.isoformat()
+            self.missing_dates[field] += 1
+            logger.debug('`%s` is None for item with `barcode=%s`. Setting '
+                         'it to now().', field, item['barcode'])
+            return datetime.now().isoformat()
+        return legacy_date_isoformat(legacy_date)
+
+    @property
+    def rejected(self):
+        """Number of items not imported, per reason."""
+        return self.rejections.counts
+
+    def migrate_item(self, item, item_pid):
+        """Return the new record of an item, ``None`` if not imported."""
+        # check barcode
+        if not item['barcode']:
+            self.rejections.reject('barcode', barcode=item['barcode'],
+                                   id_bibrec=item['id_bibrec'])
+            return None
+
+        # library id
+        if item['id_crcLIBRARY'] not in self.internal_locations:
+            self.rejections.reject('library', barcode=item['barcode'],
+                                   id_bibrec=item['id_bibrec'],
+                                   value=item['id_crcLIBRARY'])
+            return None
+        ilocid = self.internal_locations[item['id_crcLIBRARY']]
+
+        # status
+        try:
+            status = self._transform_status(item)
+        except ValueError:
+            self.rejections.reject('status', barcode=item['barcode'],
+                                   id_bibrec=item['id_bibrec'],
+                                   value=item['status'])
+            return None
+
+        # circulation_restriction
+        try:
+            circulation_restriction = self._transform_loan_period(item)
+        except ValueError:
+            self.rejections.reject('loan_period', barcode=item['barcode'],
+                                   id_bibrec=item['id_bibrec'],
+                                   value=item['loan_period'])
+            return None
+
+        try:
+            created = self._clean_date(item, 'creation_date')
+        except ValueError:
+            created = None
+
+        try:
+            updated = self._clean_date(item, 'modification_date')
+        except ValueError:
+            updated = None
+
+        return {
+            "item_pid": "{}".format(item_pid),
+            "document_pid": "to be set",
+            "internal_location_pid": "{}".format(ilocid),
+            "legacy_id": "{}".format(item['id_bibrec']),
+            "legacy_library_id": "{}".format(item['id_crcLIBRARY']),
+            "barcode": item['barcode'],
+            "shelf": item['location'],
+            "description": item['description'],
+            "status": status,
+            "circulation_restriction": circulation_restriction,
+            "medium": "",
+            "created": created,
+            "updated": updated
+        }
 
-    def migrate(self):
-        """Return items."""
-        records = []
+    def iter_migrate(self):
+        """Iterate over the new records, items are read one by one."""
         for i, item in enumerate(self.items):
-            # check barcode
-            if not item['barcode']:
-                _log = "Item with `id_bibrec = {id_bibrec}` not imported " \
-                       "because `barcode is None`".format(
-                        id_bibrec=item['id_bibrec'])
-                logger.error(_log)
-                print(_log)
-                continue
-
-            # library id
-            if item['id_crcLIBRARY'] not in self.internal_locations:
-                _log = "Item with `barcode = {barcode}` not imported because" \
-                       "`library_id={libid}` not found in imported " \
-                       "libraries".format(
-                        barcode=item['barcode'], libid=item['id_crcLIBRARY'])
-                logger.error(_log)
-                print(_log)
-                continue
-            ilocid = self.internal_locations[item['id_crcLIBRARY']]
-
-            # status
-            try:
-                status = self._transform_status(item)
-            except ValueError:
-                _log = "Item with `barcode = {barcode}` not imported because" \
-                       "`status={status}` not recognized".format(
-                        barcode=item['barcode'], status=item['status'])
-                logger.error(_log)
-                print(_log)
-                continue
-
-            # circulation_restriction
-            try:
-                circulation_restriction = self._transform_loan_period(item)
-            except ValueError:
-                _log = "Item with `barcode = {barcode}` not imported because" \
-                       " `loan_period={loan_period}` not recognized".format(
-                        barcode=item['barcode'],
-                        loan_period=item['loan_period'])
-                logger.error(_log)
-                print(_log)
-                continue
-
-            try:
-                created = self._clean_date(item['creation_date'], item)
-            except ValueError:
-                created = None
-
-            try:
-                updated = self._clean_date(item['modification_date'], item)
-            except ValueError:
-                updated = None
-
-            record = {
-                "item_pid": "{}".format(i+1),
-                "document_pid": "to be set",
-                "internal_location_pid": "{}".format(ilocid),
-                "legacy_id": "{}".format(item['id_bibrec']),
-                "legacy_library_id": "{}".format(item['id_crcLIBRARY']),
-                "barcode": item['barcode'],
-                "shelf": item['location'],
-                "description": item['description'],
-                "status": status,
-                "circulation_restriction": circulation_restriction,
-                "medium": "",
-                "created": created,
-                "updated": updated
-            }
-            records.append(record)
+            self.total += 1
+            record = self.migrate_item(item, self.item_pids[i])
+            if record is not None:
+                yield record
 
-        return records
+    def migrate(self):
+        """Return items."""
+        return list(self.iter_migrate())
@@ -10,13 +10,18 @@
 import glob
 import json
 import logging
+import multiprocessing
 import os
+from collections import Counter
 
 import click
 from flask import current_app
 
 from cds_migrator_kit.circulation.items.api import ItemsMigrator, \
     LibrariesMigrator
+from cds_migrator_kit.circulation.pids import PidAllocator
+from cds_migrator_kit.circulation.utils import RejectionLog
+from cds_migrator_kit.records.utils import iter_json_array, open_dump
 
 logger = logging.getLogger(__name__)
 
@@ -50,39 +55,114 @@ def libraries(libraries_json):
     click.secho(_log, fg='green')
 
 
-def items(items_json_folder, locations_json):
+def _migrate_items_file(args):
+    """Migrate the items of a legacy dump to a JSON Lines file.
+
+    The items not imported are written to an ``items_<n>_rejected.jsonl``
+    file next to the output file.
+
+    :param args: ``(items_json, output_filepath, internal_locations,
+        item_pids)``, ``item_pids`` being the ``PidRange`` of the dump.
+    :returns: ``(items_json, total, migrated, rejected, missing_dates)``,
+        the numbers of items of the dump, rejected items being counted per
+        reason and items without a date per date field.
+    """
+    items_json, output_filepath, internal_locations, item_pids = args
+    rejections_filepath = '{0}_rejected.jsonl'.format(
+        os.path.splitext(output_filepath)[0])
+    migrated = 0
+    with open_dump(items_json) as fp_items, \
+            open(output_filepath, 'w') as fp, \
+            RejectionLog(rejections_filepath) as rejections:
+        migrator = ItemsMigrator(iter_json_array(fp_items),
+                                 internal_locations, item_pids=item_pids,
+                                 rejections=rejections)
+        for record in migrator.iter_migrate():
+            fp.write(json.dumps(record))
+            fp.write('\n')
+            migrated += 1
+    return (items_json, migrator.total, migrated, migrator.rejected,
+            migrator.missing_dates)
+
+
+def items(items_json_folder, locations_json, workers=1):
     """Load items from JSON files.
 
+    Each dump is streamed through a worker process and its items are
+    written to an ``items_<n>.jsonl`` file. The items of the n-th dump get
+    the n-th range of ``CDS_MIGRATOR_KIT_ITEMS_PIDS_PER_DUMP`` PIDs.
+
     :param str items_json_folder: The path to the JSON dump of the legacy items
     :param str locations_json: The path to the JSON records of the new ILS
                 libraries (already migrated)
+    :param int workers: The number of dumps migrated in parallel
     """
     output_filepath = os.path.join(
         current_app.config['CDS_MIGRATOR_KIT_LOGS_PATH'],
-        'items_{0}.json'
+        'items_{0}.jsonl'
     )
 
     with open(locations_json, 'r') as fp_locations:
         locations = json.load(fp_locations)
         internal_locations = locations['internal_locations']
 
+    _files = sorted(glob.glob(os.path.join(items_json_folder, "*.json")))
+    allocator = PidAllocator(
+        current_app.config['CDS_MIGRATOR_KIT_ITEMS_PIDS_PER_DUMP'])
+    tasks = [(items_json, output_filepath.format(i), internal_locations,
+              allocator.reserve(i))
+             for i, items_json in enumerate(_files)]
+
     total_import_records = 0
     total_migrated_records = 0
-    _files = glob.glob(os.path.join(items_json_folder, "*.json"))
-    for i, items_json in enumerate(_files):
-        _log = "Importing #{0} file".format(i)
+    total_rejected_records = Counter()
+    total_missing_dates = Counter()
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.get_context('fork').Pool(workers)
+    try:
+        results = pool.imap_unordered(_migrate_items_file, tasks) if pool \
+            else map(_migrate_items_file, tasks)
+        for i, (items_json, total, migrated, rejected, missing_dates) in \
+                enumerate(results, 1):
+            _log = "Imported {0} ({1} of {2} files): {3}/{4} items".format(
+                items_json, i, len(tasks), migrated, total)
+            logger.info(_log)
+            click.secho(_log, fg='yellow')
+            total_import_records += total
+            total_migrated_records += migrated
+            total_rejected_records.update(rejected)
+            total_missing_dates.update(missing_dates)
+    except BaseException:
+        if pool:
+            pool.terminate()
+        raise
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    for reason, count in total_rejected_records.most_common():
+        _log = "Items not imported because of their {0}: {1}".format(
+            reason, count)
         logger.info(_log)
+        click.secho(_log, fg='red')
+    for field, count in total_missing_dates.most_common():
+        _log = "Items without `{0}`, set to now(): {1}".format(field, count)
+        logger.warning(_log)
         click.secho(_log, fg='yellow')
 
-        with open(items_json, 'r') as fp_items:
-            items = json.load(fp_items)
-            total_import_records += len(items)
-
-        records = ItemsMigrator(items, internal_locations).migrate()
-        total_migrated_records += len(records)
-
-        with open(output_filepath.format(i), 'w') as fp:
-            json.dump(records, fp, indent=2)
+    summary_filepath = os.path.join(
+        current_app.config['CDS_MIGRATOR_KIT_LOGS_PATH'], 'items_summary.json')
+    with open(summary_filepath, 'w') as fp:
+        json.dump(dict(total=total_import_records,
+                       migrated=total_migrated_records,
+                       rejected=dict(total_rejected_records.most_common()),
+                       missing_dates=dict(total_missing_dates.most_common())),
+                  fp, indent=2)
+    if total_rejected_records:
+        click.secho('See the items not imported in {0}'.format(
+            output_filepath.format('<n>_rejected')), fg='red')
 
     _log = "Total number of migrated records: {0}/{1}".format(
         total_migrated_records, total_import_records)
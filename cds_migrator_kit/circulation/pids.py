@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015-2018 CERN.
+#
+# cds-migrator-kit is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""CDS Migrator Circulation PIDs allocation."""
+
+
+class PidRange(object):
+    """Range of PIDs reserved for a shard of a migration."""
+
+    def __init__(self, start, size):
+        """Constructor.
+
+        :param start: first PID of the range.
+        :param size: number of PIDs in the range.
+        """
+        self.start = start
+        self.size = size
+
+    def __getitem__(self, index):
+        """Get the PID of the record at a position of the shard."""
+        if not 0 <= index < self.size:
+            raise ValueError(
+                'No PID left for record #{0}: the range starting at {1} '
+                'holds {2} PIDs.'.format(index, self.start, self.size))
+        return '{0}'.format(self.start + index)
+
+
+class PidAllocator(object):
+    """Allocate PIDs unique across the shards (f.e. dumps) of a migration.
+
+    Each shard gets its own range of PIDs and its records get the PIDs of
+    their positions in the shard, so that workers never wait on each other
+    and a rerun over the same shards gives the same PIDs.
+    """
+
+    def __init__(self, range_size, first_pid=1):
+        """Constructor.
+
+        :param range_size: number of PIDs reserved per shard.
+        :param first_pid: first PID of the first shard.
+        """
+        self.range_size = range_size
+        self.first_pid = first_pid
+
+    def reserve(self, shard):
+        """Get the range of PIDs of a shard.
+
+        :param shard: index of the shard, starting from 0.
+        """
+        return PidRange(self.first_pid + shard * self.range_size,
+                        self.range_size)
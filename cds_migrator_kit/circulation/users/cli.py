@@ -16,12 +16,49 @@ import click
 from flask import current_app
 
 from cds_migrator_kit.circulation.users.api import UserMigrator
+from cds_migrator_kit.records.utils import chunked, iter_json_array, open_dump
 
 logger = logging.getLogger(__name__)
 
 
-def users(users_json):
-    """Load users from JSON files and import in db."""
+def _bulk_import_users(session, borrowers, models, client_id, batch_size):
+    """Import users in db in batches, committing each batch.
+
+    :param session: database session.
+    :param borrowers: iterable of legacy circulation users.
+    :param models: ``(User, UserIdentity, UserProfile, RemoteAccount)``
+        models the users are inserted as.
+    :param client_id: OAuth client id of the remote accounts.
+    :param batch_size: number of users inserted at once.
+    :returns: number of imported users.
+    """
+    user_model, identity_model, profile_model, account_model = models
+    migrator = UserMigrator(None)
+    total = 0
+    for batch in chunked(borrowers, batch_size):
+        session.bulk_insert_mappings(
+            user_model, [migrator.migrate_user(b) for b in batch])
+        session.bulk_insert_mappings(
+            identity_model, [migrator.migrate_user_identity(b) for b in batch])
+        session.bulk_insert_mappings(
+            profile_model, [migrator.migrate_user_profile(b) for b in batch])
+        session.bulk_insert_mappings(
+            account_model, [dict(migrator.migrate_remote_account(b),
+                                 client_id=client_id) for b in batch])
+        session.commit()
+        total += len(batch)
+        click.secho('Migrated {0} users'.format(total), fg='green')
+    return total
+
+
+def users(users_json, bulk=False, batch_size=None):
+    """Load users from JSON files and import in db.
+
+    :param bulk: if ``True``, stream the users and insert them in batches
+        without building ORM objects, committing each batch.
+    :param batch_size: number of users inserted at once in bulk mode,
+        defaults to ``CDS_MIGRATOR_KIT_BORROWERS_BATCH_SIZE``.
+    """
     from invenio_accounts.models import User
     from invenio_db import db
     from invenio_oauthclient.models import RemoteAccount, UserIdentity
@@ -58,6 +95,18 @@ def users(users_json):
         db.session.commit()
 
     click.secho(users_json, fg='green')
+    if bulk:
+        client_id = \
+            current_app.config['CERN_APP_CREDENTIALS']['consumer_key']
+        batch_size = batch_size or \
+            current_app.config['CDS_MIGRATOR_KIT_BORROWERS_BATCH_SIZE']
+        with open_dump(users_json) as fp:
+            _bulk_import_users(
+                db.session, iter_json_array(fp),
+                (User, UserIdentity, UserProfile, RemoteAccount),
+                client_id, batch_size)
+        return
+
     with open(users_json, 'r') as fp:
         users = json.load(fp)
         total_import_records = len(users)
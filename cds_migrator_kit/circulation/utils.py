@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015-2018 CERN.
+#
+# cds-migrator-kit is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""CDS Migrator Circulation utils."""
+
+import json
+import re
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+
+#: Format of the legacy dates, f.e. ``2016-01-29T17:28:17``.
+LEGACY_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+#: Legacy dates, with the ASCII digits of each part of the date as a group.
+LEGACY_DATE_RE = re.compile(
+    r'(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})', re.ASCII)
+
+
+@lru_cache(maxsize=64 * 1024)
+def legacy_date_isoformat(legacy_date):
+    """Convert a legacy date to ISO 8601.
+
+    Dates in the fixed legacy format are matched by ``LEGACY_DATE_RE``
+    instead of going through ``datetime.strptime``, which is only used for
+    the other dates. Results are memoized, as many items share the same
+    timestamps.
+
+    :raises ValueError: if the date is not in the legacy format.
+    """
+    match = LEGACY_DATE_RE.fullmatch(legacy_date)
+    if match:
+        return datetime(*map(int, match.groups())).isoformat()
+    return datetime.strptime(legacy_date, LEGACY_DATE_FORMAT).isoformat()
+
+
+class RejectionLog(object):
+    """Count records not migrated per reason and write them as JSON Lines.
+
+    Rejections are buffered and written in batches, so that rejecting many
+    records costs about as much as migrating them.
+    """
+
+    def __init__(self, filepath=None, batch_size=1000):
+        """Constructor.
+
+        :param filepath: path to the JSON Lines file of the rejections, only
+            counted if ``None``.
+        :param batch_size: number of rejections written at once.
+        """
+        self.filepath = filepath
+        self.batch_size = batch_size
+        self.counts = Counter()
+        self._buffer = []
+        self._file = None
+
+    def reject(self, reason, **details):
+        """Log a rejected record.
+
+        :param reason: reason of the rejection, f.e. ``status``.
+        :param details: identifiers and offending value of the record.
+        """
+        self.counts[reason] += 1
+        if self.filepath is None:
+            return
+        details['reason'] = reason
+        self._buffer.append(json.dumps(details))
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rejections."""
+        if not self._buffer:
+            return
+        if self._file is None:
+            self._file = open(self.filepath, 'w')
+        self._file.write('\n'.join(self._buffer))
+        self._file.write('\n')
+        self._file.flush()
+        self._buffer = []
+
+    def close(self):
+        """Write the buffered rejections and close the file."""
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        elif self.filepath is not None:
+            # no rejections, replace the file of a previous run
+            open(self.filepath, 'w').close()
+
+    def __enter__(self):
+        """Enter the context, the log is closed when exiting it."""
+        return self
+
+    def __exit__(self, *args):
+        """Close the log."""
+        self.close()
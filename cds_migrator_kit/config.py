@@ -119,3 +119,31 @@ APP_DEFAULT_SECURE_HEADERS['content_security_policy'] = {}
 CDS_MIGRATOR_KIT_BASE_TEMPLATE = 'cds_migrator_kit_records/base.html'
 # Configuration overridden by env vars when deployed
 CDS_MIGRATOR_KIT_LOGS_PATH = './tmp/logs/'
+#: Storage of the migration reports: ``json`` documents written at the end of
+#: a dry run or ``jsonl`` files appended to as records are converted.
+CDS_MIGRATOR_KIT_LOGS_STORAGE = 'json'
+#: Number of results per page in the results views.
+CDS_MIGRATOR_KIT_RESULTS_PAGE_SIZE = 100
+#: Maximum number of results per page in the results views.
+CDS_MIGRATOR_KIT_RESULTS_MAX_SIZE = 1000
+#: Maximum number of pages, stats and records of the reports cached by each
+#: web worker.
+CDS_MIGRATOR_KIT_RESULTS_CACHE_SIZE = 10000
+#: Number of most frequent offending values listed in the report summaries.
+CDS_MIGRATOR_KIT_SUMMARY_TOP_VALUES = 20
+#: Number of records read at once when exporting the converted records.
+CDS_MIGRATOR_KIT_EXPORT_CHUNK_SIZE = 1000
+#: Parser of the MARCXML of the records converted by the dry runs: the
+#: ``default`` one of cds-dojson or ``lxml``, which reuses a single parser.
+CDS_MIGRATOR_KIT_MARCXML_PARSER = 'default'
+#: Path to the cache of the records converted by the dry runs, records whose
+#: final revision and conversion rules did not change are not converted
+#: again. ``None`` disables the cache.
+CDS_MIGRATOR_KIT_CONVERSION_CACHE = None
+#: Maximum size of the converted records cache, in bytes.
+CDS_MIGRATOR_KIT_CONVERSION_CACHE_SIZE = 1024 * 1024 * 1024
+#: Number of item PIDs reserved for each dump of legacy items, the items of
+#: the n-th dump (sorted by file name) get the n-th range of PIDs.
+CDS_MIGRATOR_KIT_ITEMS_PIDS_PER_DUMP = 1000000
+#: Number of borrowers inserted at once (and committed) in bulk mode.
+CDS_MIGRATOR_KIT_BORROWERS_BATCH_SIZE = 1000
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015-2018 CERN.
+#
+# cds-migrator-kit is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""CDS Migrator Records conversion cache."""
+
+import hashlib
+import importlib
+import json
+import os
+import time
+
+from .database import ProcessDatabase
+
+
+def rules_fingerprint(*packages):
+    """Hash the source of the packages converting the records.
+
+    :param packages: names of the packages, f.e. ``cds_dojson``.
+    :returns: hex digest, which changes whenever a module changes.
+    """
+    digest = hashlib.sha256()
+    for package in packages:
+        root = os.path.dirname(importlib.import_module(package).__file__)
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if not filename.endswith('.py'):
+                    continue
+                filepath = os.path.join(dirpath, filename)
+                digest.update(os.path.relpath(filepath, root).encode('utf-8'))
+                with open(filepath, 'rb') as f:
+                    digest.update(f.read())
+    return digest.hexdigest()
+
+
+class ConversionCache(ProcessDatabase):
+    """On-disk cache of the converted records and their stats.
+
+    Entries are keyed by a hash of the final revision of a legacy record,
+    its collections and the ``namespace`` of the conversion (rectype and
+    rules fingerprint), so that only the records whose input or rules
+    changed are converted again. The least recently used entries are
+    evicted once the cache grows over ``max_size``. The use of the entries
+    is written in batches.
+    """
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, '
+        'stats TEXT, record TEXT, size INTEGER, used REAL)',
+        'CREATE INDEX IF NOT EXISTS entries_by_used ON entries (used)',
+    )
+
+    def __init__(self, filepath, namespace, max_size, batch_size=1000):
+        """Constructor.
+
+        :param filepath: path to the SQLite database of the cache.
+        :param namespace: list identifying the conversion, part of the keys.
+        :param max_size: maximum size of the cached data, in bytes.
+        :param batch_size: number of used entries written per transaction.
+        """
+        super().__init__(filepath)
+        self.namespace = json.dumps(namespace)
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self._used = []
+
+    def key(self, item):
+        """Compute the key of a legacy record dump."""
+        revision = item['record'][-1]
+        source = revision.get('marcxml')
+        if source is None:
+            source = json.dumps(revision.get('json'), sort_keys=True)
+        digest = hashlib.sha256(self.namespace.encode('utf-8'))
+        digest.update(json.dumps(item.get('collections'),
+                                 sort_keys=True).encode('utf-8'))
+        digest.update(source.encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Get the ``(stats, record)`` of a key, ``None`` if missing."""
+        row = self.connection.execute(
+            'SELECT stats, record FROM entries WHERE key = ?', (key, )
+        ).fetchone()
+        if row is None:
+            return None
+        self.touch([key])
+        return json.loads(row[0]), json.loads(row[1])
+
+    def touch(self, keys):
+        """Mark the entries of the keys as used."""
+        self._used.extend(keys)
+        if len(self._used) >= self.batch_size:
+            self.flush()
+
+    def pop_used(self):
+        """Take the keys used since the last flush, to touch them elsewhere.
+
+        Worker processes send them to the parent process, which writes them
+        along with its own.
+        """
+        used, self._used = self._used, []
+        return used
+
+    def flush(self):
+        """Write the use of the entries touched since the last flush."""
+        if not self._used:
+            return
+        used = time.time()
+        self.connection.execute('BEGIN')
+        self.connection.executemany(
+            'UPDATE entries SET used = ? WHERE key = ?',
+            ((used, key) for key in self._used))
+        self.connection.execute('COMMIT')
+        self._used = []
+
+    def set(self, key, stats, record):
+        """Store the stats and record of a key.
+
+        :param stats: stats entry of the record, ``None`` if not logged.
+        :param record: converted record, ``None`` if the conversion failed.
+        """
+        stats, record = json.dumps(stats), json.dumps(record)
+        self.connection.execute(
+            'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+            (key, stats, record, len(stats) + len(record), time.time()))
+
+    def size(self):
+        """Size of the cached data, in bytes."""
+        return self.connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def evict(self):
+        """Evict the least recently used entries until under ``max_size``.
+
+        :returns: number of evicted entries.
+        """
+        self.flush()
+        excess = self.size() - self.max_size
+        if excess <= 0:
+            return 0
+        keys = []
+        rows = self.connection.execute(
+            'SELECT key, size FROM entries ORDER BY used')
+        for key, size in rows:
+            if excess <= 0:
+                break
+            keys.append((key, ))
+            excess -= size
+        rows.close()
+        self.connection.execute('BEGIN')
+        self.connection.executemany('DELETE FROM entries WHERE key = ?', keys)
+        self.connection.execute('COMMIT')
+        return len(keys)
+
+    def close(self):
+        """Write the pending use of the entries and close the connection."""
+        self.flush()
+        super().close()
@@ -8,8 +8,10 @@
 
 """CDS Migrator Records CLI."""
 
-import json
 import logging
+import multiprocessing
+import queue
+from collections import deque
 
 import click
 from cds_dojson.marc21.models.books.multipart import model as multipart_model
@@ -17,65 +19,369 @@ from cds_dojson.marc21.models.books.serial import model as serial_model
 from flask import current_app
 from flask.cli import with_appcontext
 
+from .cache import ConversionCache, rules_fingerprint
 from .errors import LossyConversion
+from .index import ReportIndex, TagIndex
 from .log import JsonLogger
-from .records import CDSRecordDump
+from .marcxml import get_marcxml_parser
+from .records import CDSRecordConverter
+from .utils import chunked, iter_json_array, open_dump
 
 cli_logger = logging.getLogger(__name__)
 
 
-def load_records(sources, source_type, eager, model=None, rectype=None):
-    """Load records."""
-    logger = JsonLogger.get_json_logger(rectype)
+def convert_record(item, converter, skip_errors=False, cache=None):
+    """Convert the final revision of a legacy record.
+
+    Conversion errors are logged to the stats of the converter logger.
+
+    :param item: legacy record dump.
+    :param converter: ``CDSRecordConverter`` of the run.
+    :param skip_errors: if ``True``, unexpected errors do not stop the
+        migration, the record is left out of the stats instead so that it
+        is converted again when resuming.
+    :param cache: ``ConversionCache`` of the converted records and stats.
+    :returns: the converted record or ``None`` if the conversion failed.
+    """
+    logger = converter.logger
+    recid = item['recid']
+    if cache is not None:
+        key = cache.key(item)
+        cached = cache.get(key)
+        if cached is not None:
+            stats, record = cached
+            if stats is not None:
+                logger.stats[recid] = stats
+            return record
+
+    logger.add_recid_to_stats(recid)
+    record = None
+    try:
+        record = converter.convert(item)
+    except LossyConversion as e:
+        cli_logger.error('[DATA ERROR]: {0}'.format(e.message))
+        logger.add_log(e, output=item)
+    except Exception as e:
+        cli_logger.error(e)
+        current_app.logger.error(e)
+        if skip_errors:
+            logger.stats.pop(item['recid'], None)
+            return None
+        logger.add_log(e, output=item)
+        raise e
+    if cache is not None:
+        cache.set(key, logger.stats.get(recid), record)
+    return record
+
+
+def _convert_result(item, converter, skip_errors=False, cache=None):
+    """Convert a legacy record into a ``(recid, stats, record, tags)`` result.
+
+    The stats of the record are taken out of the converter logger, to be
+    merged by ``_merge_results``. Both stats and record are ``None`` if the
+    record is skipped after an unexpected error (see ``convert_record``).
+    """
+    record = convert_record(item, converter, skip_errors=skip_errors,
+                            cache=cache)
+    stats = converter.logger.stats.pop(item['recid'], None)
+    return item['recid'], stats, record, TagIndex.record_tags(item)
+
+
+def _create_converter(model, logger):
+    """Create the record converter of a dry run."""
+    return CDSRecordConverter(
+        dojson_model=model, logger=logger,
+        parse_marcxml=get_marcxml_parser(
+            current_app.config['CDS_MIGRATOR_KIT_MARCXML_PARSER']))
+
+
+#: State of a dry run worker process, set by ``_init_worker``.
+_worker = {}
+
+
+def _create_cache(rectype):
+    """Create the conversion cache of a dry run, if enabled."""
+    filepath = current_app.config['CDS_MIGRATOR_KIT_CONVERSION_CACHE']
+    if not filepath:
+        return None
+    namespace = [rectype, rules_fingerprint('cds_dojson', 'cds_migrator_kit')]
+    return ConversionCache(
+        filepath, namespace,
+        current_app.config['CDS_MIGRATOR_KIT_CONVERSION_CACHE_SIZE'])
+
+
+def _init_worker(app, rectype, model, done, skip_errors, cache, only,
+                 chunksize, chunks):
+    """Set up a dry run worker process.
+
+    :param chunks: queue the chunks converted by ``_convert_file`` are put
+        in.
+    """
+    app.app_context().push()
+    _worker['converter'] = _create_converter(
+        model, JsonLogger.get_json_logger(rectype))
+    _worker['done'] = done
+    _worker['skip_errors'] = skip_errors
+    _worker['cache'] = cache
+    _worker['only'] = only
+    _worker['chunksize'] = chunksize
+    _worker['chunks'] = chunks
+
+
+def _convert_items(items):
+    """Convert a chunk of legacy records in a worker process.
+
+    :returns: list of ``(recid, stats, record, tags)`` tuples, to be merged
+        into the logger and tag index of the parent process, the ``Counter``
+        of the access rules which could not be migrated and the keys of the
+        cache entries used.
+    """
+    converter = _worker['converter']
+    cache = _worker['cache']
+    results = [_convert_result(item, converter,
+                               skip_errors=_worker['skip_errors'], cache=cache)
+               for item in items]
+    used = cache.pop_used() if cache is not None else []
+    return results, converter.access_cache.pop_warnings(), used
+
+
+def _convert_file(index, source):
+    """Convert all the legacy records of a dump in a worker process.
+
+    The records are converted in chunks, put in the ``chunks`` queue as
+    ``(index, chunk)`` as soon as they are converted, followed by
+    ``(index, None)`` once the dump is done.
+
+    :param index: index of the dump in the sources of the dry run.
+    """
+    chunks = _worker['chunks']
+    try:
+        with open_dump(source) as fp:
+            items = _pending(iter_json_array(fp), _worker['done'],
+                             _worker['only'])
+            for chunk in chunked(items, _worker['chunksize']):
+                chunks.put((index, _convert_items(chunk)))
+    finally:
+        chunks.put((index, None))
+
+
+def _pending(items, done, only=None):
+    """Filter out the legacy records already converted.
+
+    :param only: if given, set of the recids (as strings) of the only
+        records to convert.
+    """
+    for item in items:
+        recid = str(item['recid'])
+        if recid not in done and (only is None or recid in only):
+            yield item
+
+
+def _dump_recids(sources):
+    """Read the recids (as strings) of the legacy records of dumps."""
+    recids = set()
+    for source in sources:
+        with open_dump(source) as fp:
+            recids.update(str(item['recid']) for item in iter_json_array(fp))
+    return recids
+
+
+def _imap_bounded(pool, func, iterable, chunksize, window):
+    """Map ``func`` over chunks of ``iterable`` keeping the results order.
+
+    Unlike ``Pool.imap``, at most ``window`` chunks are queued at once, so
+    the source is not consumed faster than the workers can convert it.
+    """
+    pending = deque()
+    for chunk in chunked(iterable, chunksize):
+        pending.append(pool.apply_async(func, (chunk, )))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def _imap_files(pool, chunks, sources, progress, timeout=1):
+    """Iterate over the chunks of the dumps converted by ``_convert_file``.
+
+    Chunks are yielded in the order of the sources, the chunks of the dumps
+    converted ahead of their turn are kept until then.
+
+    :param chunks: queue the workers put the chunks in, bounded so that the
+        workers wait while it is full.
+    :param progress: called with ``1`` whenever a dump is done.
+    :param timeout: seconds between two checks of the worker processes.
+    :raises RuntimeError: if a worker process died.
+    """
+    workers = {process.pid for process in multiprocessing.active_children()}
+    results = [pool.apply_async(_convert_file, (index, source))
+               for index, source in enumerate(sources)]
+    ahead = [deque() for _ in sources]
+    done = [False] * len(sources)
+    current = 0
+    while current < len(sources):
+        if ahead[current]:
+            yield ahead[current].popleft()
+            continue
+        if done[current]:
+            progress(1)
+            current += 1
+            continue
+        try:
+            index, chunk = chunks.get(timeout=timeout)
+        except queue.Empty:
+            for result in results:
+                if result.ready() and not result.successful():
+                    result.get()
+            # a worker killed (f.e. out of memory) never puts its dump done
+            alive = {process.pid
+                     for process in multiprocessing.active_children()}
+            if not workers <= alive:
+                raise RuntimeError('A worker process died while converting '
+                                   'the dumps.')
+            continue
+        if chunk is None:
+            done[index] = True
+            # raise the error of the worker, if any
+            results[index].get()
+        elif index == current:
+            yield chunk
+        else:
+            ahead[index].append(chunk)
 
-    for idx, source in enumerate(sources, 1):
-        click.secho('Loading dump {0} of {1} ({2})'.format(
-            idx, len(sources), source), fg='yellow')
-        content = None
-        with open(source.name, 'r+') as file:
-            content = file.read().encode('UTF-8')
-        with open(source.name, 'wb') as file:
-            file.write(content)
-            file.close()
-        data = json.load(source)
-        source.close()
-        with click.progressbar(data) as records:
-            for item in records:
-                dump = CDSRecordDump(
-                    data=item,
-                    dojson_model=model,
-                    logger=logger
-                )
-                click.echo('Processing item {0}...'.format(item['recid']))
-                logger.add_recid_to_stats(item['recid'])
-                try:
-                    dump.prepare_revisions()
-                    logger.add_record(dump.revisions[-1][1])
-
-                except LossyConversion as e:
-                    cli_logger.error('[DATA ERROR]: {0}'.format(e.message))
-                    logger.add_log(e, output=item)
-                # except AttributeError as e:
-                #     current_app.logger.error('Model missing')
-                #     JsonLogger().add_log(e, output=item, rectype=rectype)
-                #     raise e
-                # except TypeError as e:
-                #     current_app.logger.error(
-                #         'Model missing recid:{}'.format(item['recid']))
-                #     JsonLogger().add_log(e, output=item, rectype=rectype)
-                #     raise e
-                # except KeyError as e:
-                #     current_app.logger.error(
-                #         'Model missing recid:{}'.format(item['recid']))
-                #     JsonLogger().add_log(e, output=item, rectype=rectype)
-                except Exception as e:
-                    cli_logger.error(e)
-                    current_app.logger.error(e)
-                    logger.add_log(e, output=item)
-                    raise e
-        logger.save()
-        click.secho('Check completed. See the report on: '
-                    'books-migrator-dev.web.cern.ch/results', fg='green')
+
+def _merge_chunks(converter, cache, chunks):
+    """Iterate over the results of chunks converted in worker processes.
+
+    The access warnings of the workers are added to the ones of
+    ``converter`` and the cache entries they used are touched in ``cache``.
+    """
+    for results, warnings, used in chunks:
+        converter.access_cache.warnings.update(warnings)
+        if cache is not None:
+            cache.touch(used)
+        yield from results
+
+
+def _merge_results(logger, tags, results):
+    """Merge ``(recid, stats, record, tags)`` conversion results.
+
+    :param logger: logger of the stats and records.
+    :param tags: ``TagIndex`` of the MARC tags of the records.
+    """
+    for recid, stats, record, record_tags in results:
+        if stats is None and record is None:
+            click.secho('Skipping item {0}...'.format(recid), fg='red')
+            continue
+        click.echo('Processing item {0}...'.format(recid))
+        logger.merge_stats(recid, stats)
+        if record is not None:
+            logger.add_record(record)
+        logger.flush()
+        tags.add(recid, record_tags)
+
+
+def load_records(sources, source_type, eager, model=None, rectype=None,
+                 workers=1, chunksize=10, per_file=False, storage=None,
+                 resume=False, cache=True, only_tags=None):
+    """Load records.
+
+    :param workers: number of worker processes converting the records, the
+        records are converted in the current process if ``1``.
+    :param chunksize: number of records converted by a worker at once.
+    :param per_file: if ``True``, each worker converts whole dumps instead
+        of chunks of records.
+    :param storage: name of the storage of the report, defaults to
+        ``CDS_MIGRATOR_KIT_LOGS_STORAGE``.
+    :param resume: if ``True``, keep the records already written to the
+        (incremental) storage by an interrupted run, skip them and carry on
+        past unexpected conversion errors.
+    :param cache: if ``False``, convert all the records again instead of
+        reusing the ones of ``CDS_MIGRATOR_KIT_CONVERSION_CACHE``.
+    :param only_tags: if given, convert again only the records of
+        ``sources`` having one of these MARC tags (as indexed by previous
+        dry runs) and update their stats and records in the existing
+        report, keeping the other records as they are.
+    """
+    logger = JsonLogger.get_json_logger(rectype, storage=storage,
+                                        workers=workers)
+    done = set()
+    if resume:
+        done = logger.resume()
+        click.secho('Resuming, skipping {0} converted records'.format(
+            len(done)), fg='yellow')
+    converter = _create_converter(model, logger)
+    cache = _create_cache(rectype) if cache else None
+    tags = TagIndex(logger.TAGS_FILEPATH)
+    only = None
+    if only_tags:
+        try:
+            only = tags.recids(only_tags) & _dump_recids(sources)
+            logger.load()
+        except FileNotFoundError:
+            raise click.UsageError(
+                'No report of {0} to update, run a full dry run '
+                'first.'.format(rectype))
+        logger.discard(only)
+        click.secho('Converting again {0} records with the tags {1}'.format(
+            len(only), ', '.join(only_tags)), fg='yellow')
+    pool = None
+    if workers > 1:
+        # fork, so that the application is shared with the workers as is
+        context = multiprocessing.get_context('fork')
+        chunks = context.Queue(2 * workers) if per_file else None
+        pool = context.Pool(
+            workers,
+            initializer=_init_worker,
+            initargs=(current_app._get_current_object(), rectype, model,
+                      done, resume, cache, only, chunksize, chunks)
+        )
+
+    try:
+        if pool and per_file:
+            click.secho('Loading {0} dumps in parallel'.format(
+                len(sources)), fg='yellow')
+            with click.progressbar(length=len(sources)) as bar:
+                _merge_results(logger, tags, _merge_chunks(
+                    converter, cache,
+                    _imap_files(pool, chunks, sources, bar.update)))
+        else:
+            for idx, source in enumerate(sources, 1):
+                click.secho('Loading dump {0} of {1} ({2})'.format(
+                    idx, len(sources), source), fg='yellow')
+                with open_dump(source) as fp, \
+                        click.progressbar(iter_json_array(fp)) as items:
+                    records = _pending(items, done, only)
+                    if pool:
+                        results = _merge_chunks(
+                            converter, cache, _imap_bounded(
+                                pool, _convert_items, records, chunksize,
+                                window=2 * workers))
+                    else:
+                        results = (
+                            _convert_result(item, converter,
+                                            skip_errors=resume, cache=cache)
+                            for item in records
+                        )
+                    _merge_results(logger, tags, results)
+    except BaseException:
+        if pool:
+            pool.terminate()
+        raise
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    for message, count in converter.access_cache.warnings.most_common():
+        current_app.logger.warning('{0} ({1} records)'.format(message, count))
+    if cache:
+        cache.evict()
+        cache.close()
+    tags.close()
+    logger.save()
+    click.secho('Check completed. See the report on: '
+                'books-migrator-dev.web.cern.ch/results', fg='green')
 
 
 @click.group()
@@ -84,8 +390,8 @@ def report():
 
 
 @report.command()
-@click.argument('sources', type=click.File('r', encoding='UTF-8',
-                                           errors='replace'), nargs=-1)
+@click.argument('sources', type=click.Path(exists=True, dir_okay=False),
+                nargs=-1)
 @click.option(
     '--source-type',
     '-t',
@@ -102,12 +408,106 @@ def report():
     '-x',
     help='Type of record to load (f.e serial).',
     default='document')
+@click.option(
+    '--workers',
+    '-w',
+    type=click.IntRange(min=1),
+    help='Number of processes converting the records in parallel.',
+    default=1)
+@click.option(
+    '--per-file',
+    is_flag=True,
+    help='Convert each dump as a whole in its own worker process.',
+    default=False)
+@click.option(
+    '--storage',
+    '-s',
+    type=click.Choice(['json', 'jsonl']),
+    help='Storage of the report, JSON Lines are written incrementally.',
+    default=None)
+@click.option(
+    '--resume',
+    is_flag=True,
+    help='Skip the records converted by an interrupted run and carry on '
+         'past conversion errors (uses the jsonl storage).',
+    default=False)
+@click.option(
+    '--no-cache',
+    is_flag=True,
+    help='Convert all the records again, ignoring the conversion cache.',
+    default=False)
+@click.option(
+    '--only-tags',
+    help='Comma separated MARC tags of the rules which changed (f.e. '
+         '260,020): convert again only the records having them and update '
+         'the existing report.',
+    default=None)
 @with_appcontext
-def dryrun(sources, source_type, recid, rectype, model=None):
+def dryrun(sources, source_type, recid, rectype, workers, per_file, storage,
+           resume, no_cache, only_tags, model=None):
     """Load records migration dump."""
+    if only_tags is not None:
+        only_tags = [tag.strip()[:3] for tag in only_tags.split(',')
+                     if tag.strip()]
+        if rectype == 'serial' or resume or not only_tags:
+            raise click.BadParameter(
+                'Give at least one tag, updating a report is not available '
+                'for serials or when resuming.', param_hint='--only-tags')
+    if resume:
+        if rectype == 'serial' or storage == 'json':
+            raise click.BadParameter(
+                'Resuming needs the jsonl storage and is not available for '
+                'serials.', param_hint='--resume')
+        storage = 'jsonl'
     if rectype == 'multipart':
         model = multipart_model
     elif rectype == 'serial':
         model = serial_model
     load_records(sources=sources, source_type=source_type, eager=True,
-                 model=model, rectype=rectype)
+                 model=model, rectype=rectype, workers=workers,
+                 per_file=per_file, storage=storage, resume=resume,
+                 cache=not no_cache, only_tags=only_tags)
+
+
+@report.command()
+@click.option(
+    '--rectype',
+    '-x',
+    help='Type of the records to export (f.e serial).',
+    default='document')
+@click.option(
+    '--start',
+    type=int,
+    help='Lowest legacy recid to export.',
+    default=None)
+@click.option(
+    '--end',
+    type=int,
+    help='Highest legacy recid to export.',
+    default=None)
+@click.option(
+    '--status',
+    type=click.Choice(['clean', 'dirty']),
+    help='Export only the clean or the dirty records.',
+    default=None)
+@click.option(
+    '--output',
+    '-o',
+    type=click.File('w'),
+    help='File the records are written to (default: standard output).',
+    default='-')
+@with_appcontext
+def export(rectype, start, end, status, output):
+    """Export the records converted by a dry run as JSON Lines."""
+    logger = JsonLogger.get_json_logger(rectype)
+    try:
+        index = ReportIndex.for_logger(logger)
+    except FileNotFoundError:
+        raise click.UsageError(
+            'No report found for {0}, run a dry run first.'.format(rectype))
+    for chunk in index.export(
+            start=start, end=end,
+            clean=None if status is None else status == 'clean',
+            chunk_size=current_app.config[
+                'CDS_MIGRATOR_KIT_EXPORT_CHUNK_SIZE']):
+        output.write(chunk)
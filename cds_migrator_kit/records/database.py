@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015-2018 CERN.
+#
+# cds-migrator-kit is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""CDS Migrator Records SQLite databases."""
+
+import os
+import sqlite3
+
+
+class ProcessDatabase(object):
+    """SQLite database opened once per process.
+
+    The connection is not shared with forked worker processes, each process
+    opens its own on first use. Transactions are managed explicitly.
+    """
+
+    #: Statements creating the schema of the database, if missing.
+    SCHEMA = ()
+
+    def __init__(self, filepath):
+        """Constructor."""
+        self.filepath = filepath
+        self._connection = None
+        self._pid = None
+
+    @property
+    def connection(self):
+        """Connection of the current process to the database."""
+        if self._connection is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._connection = sqlite3.connect(
+                self.filepath, timeout=60, isolation_level=None)
+            self._connection.execute('PRAGMA journal_mode = WAL')
+            self._connection.execute('PRAGMA synchronous = NORMAL')
+            for statement in self.SCHEMA:
+                self._connection.execute(statement)
+        return self._connection
+
+    def close(self):
+        """Close the connection of the current process to the database."""
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
@@ -0,0 +1,596 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015-2018 CERN.
+#
+# cds-migrator-kit is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""CDS Migrator Records report index."""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from .database import ProcessDatabase
+
+_missing = object()
+
+#: Version of the index schema, indexes of other versions are rebuilt.
+SCHEMA_VERSION = 3
+
+#: Categories of the errors of the stats entries.
+ERROR_CATEGORIES = (
+    'manual_migration',
+    'unexpected_value',
+    'missing_required_field',
+    'lost_data',
+)
+
+
+def iter_errors(stats):
+    """Iterate over the ``(category, key, subfield, value, message)`` rows.
+
+    Lost data is indexed by missing MARC field, errors logged as plain
+    messages have no key.
+    """
+    for category in ERROR_CATEGORIES:
+        for error in stats.get(category, ()):
+            if not isinstance(error, dict):
+                yield category, None, None, None, str(error)
+            elif category == 'lost_data':
+                for missing in error.get('missing') or ():
+                    yield category, missing, None, None, error.get('message')
+            else:
+                yield (category, error.get('key'), error.get('subfield'),
+                       json.dumps(error.get('value')), error.get('message'))
+
+
+def file_signature(filepath):
+    """Identify the current version of a file, ``None`` if missing.
+
+    :returns: ``(path, mtime in ns, size)`` of the file.
+    """
+    try:
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    return filepath, stat.st_mtime_ns, stat.st_size
+
+
+def report_sources(storage):
+    """Identify the stats and records files of a report storage."""
+    return [file_signature(filepath)
+            for filepath in (storage.stats_filepath, storage.records_filepath)]
+
+
+def record_recid(key):
+    """Get the legacy recid of a record key, f.e. ``123`` or ``123-doc-1``.
+
+    :returns: the recid or ``None`` if the key does not start with one.
+    """
+    match = re.match(r'\d+', str(key))
+    return int(match.group()) if match else None
+
+
+class LRUCache(object):
+    """Thread-safe mapping keeping the ``maxsize`` last used items."""
+
+    def __init__(self, maxsize):
+        """Constructor."""
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Get an item and mark it as the last used."""
+        with self._lock:
+            try:
+                self._items.move_to_end(key)
+            except KeyError:
+                return default
+            return self._items[key]
+
+    def set(self, key, value):
+        """Set an item, evicting the least recently used items if full."""
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        """Number of items."""
+        return len(self._items)
+
+
+class IndexMapping(object):
+    """Read-only mapping over a table of a report index."""
+
+    def __init__(self, index, table):
+        """Constructor."""
+        self.index = index
+        self.table = table
+
+    def get(self, key, default=None):
+        """Get the value of a key."""
+        value = self.index.cached(self.table, str(key))
+        return default if value is None else value
+
+    def _fetch(self, key):
+        """Read the value of a key from the index database."""
+        row = self.index.connection.execute(
+            'SELECT data FROM {0} WHERE key = ?'.format(self.table),
+            (key, )
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def __getitem__(self, key):
+        """Get the value of a key or raise ``KeyError``."""
+        value = self.get(key, _missing)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        """Check if a key exists."""
+        return self.get(key, _missing) is not _missing
+
+
+class ReportIndex(object):
+    """SQLite index of the stats and records of a migration report.
+
+    Stats and records are stored by key, so that a page of stats or a single
+    record is read without parsing the whole report. The index keeps the
+    path, modification time and size of the report files it is built from,
+    to be built again once they change.
+    """
+
+    def __init__(self, filepath, cache=None, version=None):
+        """Constructor.
+
+        :param cache: ``LRUCache`` keeping the data read from the index.
+        :param version: version of the report the index was built from, to
+            tell apart the cached data of successive reports.
+        """
+        self.filepath = filepath
+        self.cache = cache
+        self.version = version
+        self.sources = None
+        self._local = threading.local()
+        self.stats = IndexMapping(self, 'stats')
+        self.records = IndexMapping(self, 'records')
+
+    @classmethod
+    def for_logger(cls, logger, **kwargs):
+        """Get the index of the report of a logger.
+
+        Saving a report always rewrites its index, whatever the storage of
+        the report. The index is built again from the report storage of the
+        logger if it is not current (see ``is_current``).
+
+        :raises FileNotFoundError: if the report does not exist.
+        """
+        index = cls(logger.INDEX_FILEPATH, **kwargs)
+        if not index.is_current(logger.storage):
+            if not logger.storage.exists():
+                raise FileNotFoundError(logger.storage.stats_filepath)
+            sources = report_sources(logger.storage)
+            index.build(logger.storage.iter_stats(),
+                        logger.storage.iter_records(), sources=sources)
+        return index
+
+    def is_current(self, storage=None):
+        """Check if the index is up to date with its report.
+
+        The index must exist, have the current schema version and the report
+        files it was built from must not have changed since.
+
+        :param storage: report storage of the logger reading the index, its
+            files must not be newer than the ones the index was built from
+            (f.e. a report of another storage copied over).
+        """
+        if not os.path.exists(self.filepath):
+            return False
+        if self.sources is None:
+            connection = self.connection
+            version, = connection.execute('PRAGMA user_version').fetchone()
+            if version == SCHEMA_VERSION:
+                self.sources = [tuple(row) for row in connection.execute(
+                    'SELECT path, mtime_ns, size FROM sources')]
+            self.close()
+            if self.sources is None:
+                return False
+        if any(file_signature(source[0]) != source
+               for source in self.sources):
+            return False
+        if storage is not None:
+            paths = {path for path, mtime_ns, size in self.sources}
+            built = max([mtime_ns for path, mtime_ns, size in self.sources],
+                        default=0)
+            for source in report_sources(storage):
+                if source and source[0] not in paths and source[1] > built:
+                    return False
+        return True
+
+    @property
+    def connection(self):
+        """Connection of the current thread to the index database."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(
+                self.filepath)
+        return connection
+
+    def close(self):
+        """Close the connection of the current thread."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def cached(self, name, *args):
+        """Read data from the cache or, on a miss, from the database.
+
+        :param name: ``count``, ``page`` or the name of a table.
+        :param args: arguments of the read (page number and size, key).
+        """
+        if name in ('stats', 'records'):
+            fetch = getattr(self, name)._fetch
+        else:
+            fetch = getattr(self, '_{0}'.format(name))
+        if self.cache is None:
+            return fetch(*args)
+        key = (self.filepath, self.version, name) + args
+        value = self.cache.get(key, _missing)
+        if value is _missing:
+            value = fetch(*args)
+            self.cache.set(key, value)
+        return value
+
+    def build(self, stats, records, sources=()):
+        """Build the index.
+
+        The index is written to a temporary file first, so that readers keep
+        using the previous index until the new one is complete.
+
+        :param stats: iterable of ``(key, stats)``.
+        :param records: iterable of ``(key, record)``.
+        :param sources: signatures of the report files read (see
+            ``report_sources``), taken before reading them.
+        """
+        sources = [tuple(source) for source in sources if source]
+        self.close()
+        tmp_filepath = '{0}.{1}.tmp'.format(self.filepath, os.getpid())
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+        connection = sqlite3.connect(tmp_filepath)
+        try:
+            connection.execute(
+                'CREATE TABLE stats '
+                '(key TEXT PRIMARY KEY, clean INTEGER, data TEXT)')
+            connection.execute(
+                'CREATE TABLE records '
+                '(key TEXT PRIMARY KEY, recid INTEGER, clean INTEGER, '
+                'data TEXT)')
+            connection.execute(
+                'CREATE TABLE errors (stats_key TEXT, category TEXT, '
+                'key TEXT, subfield TEXT, value TEXT, message TEXT)')
+            connection.execute(
+                'CREATE INDEX errors_by_stats_key ON errors (stats_key)')
+            connection.execute(
+                'CREATE TABLE sources '
+                '(path TEXT, mtime_ns INTEGER, size INTEGER)')
+            connection.executemany(
+                'INSERT INTO sources VALUES (?, ?, ?)', sources)
+            for key, value in stats:
+                key = str(key)
+                # replace the errors of a key written more than once
+                connection.execute(
+                    'DELETE FROM errors WHERE stats_key = ?', (key, ))
+                connection.execute(
+                    'INSERT OR REPLACE INTO stats VALUES (?, ?, ?)',
+                    (key, value.get('clean'), json.dumps(value)))
+                connection.executemany(
+                    'INSERT INTO errors VALUES (?, ?, ?, ?, ?, ?)',
+                    ((key, ) + row for row in iter_errors(value)))
+            connection.executemany(
+                'INSERT OR REPLACE INTO records VALUES (?, ?, NULL, ?)',
+                ((str(key), record_recid(key), json.dumps(value))
+                 for key, value in records)
+            )
+            # records created from another one (f.e. the documents of a
+            # multipart) share the stats entry of their legacy recid
+            connection.execute(
+                'UPDATE records SET clean = COALESCE('
+                '(SELECT clean FROM stats WHERE stats.key = records.key), '
+                '(SELECT clean FROM stats '
+                'WHERE stats.key = CAST(records.recid AS TEXT)))')
+            # inverted indexes, created once the tables are filled
+            connection.execute(
+                'CREATE INDEX errors_by_category '
+                'ON errors (category, key, subfield)')
+            connection.execute(
+                'CREATE INDEX errors_by_field ON errors (key, subfield)')
+            connection.execute('CREATE INDEX stats_by_clean ON stats (clean)')
+            connection.execute(
+                'CREATE INDEX records_by_recid ON records (recid, key)')
+            connection.execute(
+                'PRAGMA user_version = {0}'.format(SCHEMA_VERSION))
+            connection.commit()
+        finally:
+            connection.close()
+        os.replace(tmp_filepath, self.filepath)
+        self.sources = sources
+
+    def count(self):
+        """Count the stats entries."""
+        return self.cached('count')
+
+    def _count(self):
+        """Count the stats entries in the database."""
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM stats').fetchone()[0]
+
+    def iter_stats(self):
+        """Iterate over the ``(key, stats)`` pairs, one per key."""
+        rows = self.connection.execute('SELECT key, data FROM stats')
+        for key, data in rows:
+            yield key, json.loads(data)
+
+    def page(self, page, size):
+        """Get a page of stats, sorted by key.
+
+        :param page: number of the page, starting from 1.
+        :param size: number of stats per page.
+        """
+        return self.cached('page', page, size)
+
+    def _page(self, page, size):
+        """Read a page of stats from the database."""
+        rows = self.connection.execute(
+            'SELECT data FROM stats ORDER BY key LIMIT ? OFFSET ?',
+            (size, (page - 1) * size)
+        )
+        return [json.loads(data) for data, in rows]
+
+    def errors(self, category=None, key=None, subfield=None, page=1,
+               size=100):
+        """Get a page of the errors matching the given filters.
+
+        :returns: list of errors as dicts, with the ``recid`` (key of the
+            stats entry) and ``category`` of the error.
+        """
+        return self.cached('errors', category, key, subfield, page, size)
+
+    @staticmethod
+    def _filters(category, key, subfield):
+        """Build the SQL conditions of errors filters."""
+        conditions, params = [], []
+        for column, value in (('category', category), ('key', key),
+                              ('subfield', subfield)):
+            if value is not None:
+                conditions.append('{0} = ?'.format(column))
+                params.append(value)
+        where = 'WHERE {0}'.format(' AND '.join(conditions)) \
+            if conditions else ''
+        return where, params
+
+    def _errors(self, category, key, subfield, page, size):
+        """Read a page of filtered errors from the database."""
+        where, params = self._filters(category, key, subfield)
+        rows = self.connection.execute(
+            'SELECT stats_key, category, key, subfield, value, message '
+            'FROM errors {0} ORDER BY stats_key, rowid '
+            'LIMIT ? OFFSET ?'.format(where),
+            params + [size, (page - 1) * size]
+        )
+        return [
+            dict(recid=recid, category=category, key=key, subfield=subfield,
+                 value=json.loads(value) if value is not None else None,
+                 message=message)
+            for recid, category, key, subfield, value, message in rows
+        ]
+
+    def count_errors(self, category=None, by_subfield=False):
+        """Count the errors per MARC key (and subfield).
+
+        :returns: list of counts as dicts, most frequent first.
+        """
+        return self.cached('count_errors', category, by_subfield)
+
+    def _count_errors(self, category, by_subfield):
+        """Count the errors per MARC key in the database."""
+        where, params = self._filters(category, None, None)
+        columns = 'key, subfield' if by_subfield else 'key'
+        rows = self.connection.execute(
+            'SELECT {0}, COUNT(*), COUNT(DISTINCT stats_key) FROM errors {1} '
+            'GROUP BY {0} ORDER BY COUNT(*) DESC, {0}'.format(
+                columns, where),
+            params
+        )
+        results = []
+        for row in rows:
+            result = dict(key=row[0], count=row[-2], records=row[-1])
+            if by_subfield:
+                result['subfield'] = row[1]
+            results.append(result)
+        return results
+
+    def dirty(self, page=1, size=100):
+        """Get a page of the keys of the stats entries which are not clean."""
+        return self.cached('dirty', page, size)
+
+    def _dirty(self, page, size):
+        """Read a page of not clean stats keys from the database."""
+        rows = self.connection.execute(
+            'SELECT key FROM stats WHERE clean = 0 ORDER BY key '
+            'LIMIT ? OFFSET ?',
+            (size, (page - 1) * size)
+        )
+        return [key for key, in rows]
+
+    def export(self, start=None, end=None, clean=None, chunk_size=1000):
+        """Export records as JSON Lines, sorted by recid.
+
+        Records are read from the database in chunks, so that only one chunk
+        is kept in memory at once.
+
+        :param start: lowest recid exported.
+        :param end: highest recid exported.
+        :param clean: export only the clean (``True``) or not clean
+            (``False``) records.
+        :param chunk_size: number of records per chunk.
+        :returns: iterator of chunks of lines, as strings.
+        """
+        conditions, params = [], []
+        if start is not None:
+            conditions.append('recid >= ?')
+            params.append(start)
+        if end is not None:
+            conditions.append('recid <= ?')
+            params.append(end)
+        if clean is not None:
+            conditions.append('clean = ?')
+            params.append(int(clean))
+        where = 'WHERE {0}'.format(' AND '.join(conditions)) \
+            if conditions else ''
+        # own connection, the export might outlive the current request
+        connection = sqlite3.connect(self.filepath)
+        try:
+            cursor = connection.execute(
+                'SELECT data FROM records {0} '
+                'ORDER BY recid, key'.format(where),
+                params
+            )
+            rows = cursor.fetchmany(chunk_size)
+            while rows:
+                yield ''.join('{0}\n'.format(data) for data, in rows)
+                rows = cursor.fetchmany(chunk_size)
+        finally:
+            connection.close()
+
+
+class TagIndex(ProcessDatabase):
+    """SQLite index of the legacy records by MARC tag.
+
+    Filled while converting records, so that a later dry run can convert
+    again only the records having the tags of the conversion rules which
+    changed. The tags of the records are written in batches, by the process
+    logging the records.
+    """
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS tags (tag TEXT, recid TEXT, '
+        'PRIMARY KEY (tag, recid)) WITHOUT ROWID',
+        'CREATE INDEX IF NOT EXISTS tags_by_recid ON tags (recid)',
+    )
+
+    #: Tags of the control and data fields of a MARCXML record.
+    TAG_RE = re.compile(
+        r'<(?:\w+:)?(?:control|data)field[^>]*\btag=["\'](\w+)')
+
+    def __init__(self, filepath, batch_size=1000):
+        """Constructor.
+
+        :param batch_size: number of records written per transaction.
+        """
+        super().__init__(filepath)
+        self.batch_size = batch_size
+        self._pending = {}
+
+    @classmethod
+    def record_tags(cls, item):
+        """Get the tags of the final revision of a legacy record dump."""
+        marcxml = item['record'][-1].get('marcxml') or ''
+        return sorted(set(cls.TAG_RE.findall(marcxml)))
+
+    def add(self, recid, tags):
+        """Index the tags of a record, replacing the previous ones."""
+        self._pending[str(recid)] = tags
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write the tags of the records added since the last flush."""
+        if not self._pending:
+            return
+        connection = self.connection
+        connection.execute('BEGIN')
+        connection.executemany('DELETE FROM tags WHERE recid = ?',
+                               ((recid, ) for recid in self._pending))
+        connection.executemany('INSERT INTO tags VALUES (?, ?)',
+                               ((tag, recid)
+                                for recid, tags in self._pending.items()
+                                for tag in tags))
+        connection.execute('COMMIT')
+        self._pending = {}
+
+    def recids(self, tags):
+        """Find the records having any of the tags, recids as strings.
+
+        :raises FileNotFoundError: if the index does not exist.
+        """
+        if not os.path.exists(self.filepath):
+            raise FileNotFoundError(self.filepath)
+        tags = list(tags)
+        rows = self.connection.execute(
+            'SELECT DISTINCT recid FROM tags WHERE tag IN ({0})'.format(
+                ', '.join('?' * len(tags))),
+            tags
+        )
+        return {recid for recid, in rows}
+
+    def close(self):
+        """Write the pending tags and close the connection."""
+        self.flush()
+        super().close()
+
+
+class ReportCache(object):
+    """Per process cache of report indexes and of the data read from them.
+
+    An index is reused as long as its file is not replaced, that is until a
+    new dry run saves its report, and as long as the report files it was
+    built from do not change. The data read from all the indexes share a
+    single LRU cache.
+    """
+
+    def __init__(self, maxsize):
+        """Constructor.
+
+        :param maxsize: maximum number of pages, stats and records cached.
+        """
+        self.data = LRUCache(maxsize)
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _version(filepath):
+        """Identify the current file of an index, ``None`` if missing."""
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def index(self, logger):
+        """Get the index of the report of a logger.
+
+        :raises FileNotFoundError: if the report does not exist.
+        """
+        filepath = logger.INDEX_FILEPATH
+        version = self._version(filepath)
+        with self._lock:
+            index = self._indexes.get(filepath)
+            if index is None or version is None or \
+                    index.version != version or \
+                    not index.is_current(logger.storage):
+                index = ReportIndex.for_logger(logger, cache=self.data)
+                # the index might have been (re)built from the report
+                index.version = self._version(filepath)
+                self._indexes[filepath] = index
+        return index
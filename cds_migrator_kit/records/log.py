@@ -11,7 +11,10 @@
 import copy
 import json
 import logging
+import multiprocessing
 import os
+from collections import defaultdict
+from itertools import chain
 
 from cds_dojson.marc21.fields.books.errors import ManualMigrationRequired, \
     MissingRequiredField, UnexpectedValue
@@ -19,8 +22,11 @@ from flask import current_app
 from fuzzywuzzy import fuzz
 
 from cds_migrator_kit.records.errors import LossyConversion
-from cds_migrator_kit.records.utils import clean_exception_message, \
-    compare_titles, same_issn
+from cds_migrator_kit.records.index import ReportIndex, report_sources
+from cds_migrator_kit.records.storage import STORAGES
+from cds_migrator_kit.records.summary import summarize
+from cds_migrator_kit.records.utils import chunked, clean_exception_message, \
+    compare_titles_bulk, similar_title_pairs
 
 
 def set_logging():
@@ -50,30 +56,66 @@ def set_logging():
 logger = logging.getLogger('migrator')
 
 
+def _match_titles(rows):
+    """Find the similar titles among candidate pairs.
+
+    :param rows: list of ``(i, title, candidates)`` where ``candidates`` is a
+        list of ``(j, title)`` to compare with.
+    :returns: list of ``(i, j)`` pairs of similar titles.
+    """
+    matches = []
+    for i, title, candidates in rows:
+        ratios = compare_titles_bulk(
+            title, [other for _, other in candidates])
+        matches.extend((i, j) for (j, _), ratio in zip(candidates, ratios)
+                       if 95 <= ratio < 100)
+    return matches
+
+
 class JsonLogger(object):
     """Log migration statistic to file controller."""
 
     LOG_FILEPATH = None
 
     @classmethod
-    def get_json_logger(cls, rectype):
-        """Get JsonLogger instance based on the rectype."""
+    def get_json_logger(cls, rectype, storage=None, workers=1):
+        """Get JsonLogger instance based on the rectype.
+
+        :param storage: name of the storage of stats and records.
+        :param workers: number of processes matching similar serials.
+        """
         if rectype == 'serial':
-            return SerialJsonLogger()
+            return SerialJsonLogger(storage=storage, workers=workers)
         elif rectype == 'document':
-            return DocumentJsonLogger()
+            return DocumentJsonLogger(storage=storage)
         elif rectype == 'multipart':
-            return MultipartJsonLogger()
+            return MultipartJsonLogger(storage=storage)
         else:
             raise Exception('Invalid rectype: {}'.format(rectype))
 
-    def __init__(self, stats_filename, records_filename):
-        """Constructor."""
+    def __init__(self, stats_filename, records_filename, storage=None):
+        """Constructor.
+
+        :param storage: name of the storage of stats and records (see
+            ``STORAGES``), defaults to ``CDS_MIGRATOR_KIT_LOGS_STORAGE``.
+        """
         self._logs_path = current_app.config['CDS_MIGRATOR_KIT_LOGS_PATH']
         self.stats = {}
         self.records = {}
-        self.STAT_FILEPATH = os.path.join(self._logs_path, stats_filename)
-        self.RECORD_FILEPATH = os.path.join(self._logs_path, records_filename)
+        storage = storage or current_app.config.get(
+            'CDS_MIGRATOR_KIT_LOGS_STORAGE', 'json')
+        self.storage = STORAGES[storage](
+            os.path.join(self._logs_path, stats_filename),
+            os.path.join(self._logs_path, records_filename),
+        )
+        self.STAT_FILEPATH = self.storage.stats_filepath
+        self.RECORD_FILEPATH = self.storage.records_filepath
+        self.INDEX_FILEPATH = '{0}.sqlite'.format(
+            os.path.splitext(self.STAT_FILEPATH)[0])
+        self.SUMMARY_FILEPATH = '{0}_summary.json'.format(
+            os.path.splitext(self.STAT_FILEPATH)[0])
+        self.TAGS_FILEPATH = '{0}_tags.sqlite'.format(
+            os.path.splitext(self.STAT_FILEPATH)[0])
 
         if not os.path.exists(self._logs_path):
             os.makedirs(self._logs_path)
@@ -81,18 +123,59 @@ class JsonLogger(object):
     def load(self):
         """Load stats from file as json."""
         logger.warning(self.STAT_FILEPATH)
-        with open(self.STAT_FILEPATH, "r") as f:
-            self.stats = json.load(f)
-        with open(self.RECORD_FILEPATH, "r") as f:
-            self.records = json.load(f)
+        self.stats, self.records = self.storage.load()
+
+    def discard(self, keys):
+        """Remove the stats and records of loaded legacy records.
+
+        :param keys: set of the keys (as strings) of the records.
+        """
+        for data in (self.stats, self.records):
+            for key in [key for key in data if str(key) in keys]:
+                del data[key]
+
+    def resume(self):
+        """Resume a report interrupted while being written incrementally.
+
+        A report of a storage which is not incremental is only written once
+        saved, there is nothing to resume.
+
+        :returns: set of the keys (as strings) of the stats already written.
+        """
+        if not self.storage.incremental:
+            return set()
+        return self.storage.resume()
+
+    def flush(self):
+        """Write the collected stats and records if storage is incremental.
+
+        Once written, stats and records are no longer kept in memory.
+        """
+        if self.storage.incremental:
+            self.storage.append(self.stats, self.records)
+            self.stats = {}
+            self.records = {}
+
+    def _iter_saved(self):
+        """Iterate over the saved ``(key, stats)`` and ``(key, record)``."""
+        if self.storage.incremental:
+            return self.storage.iter_stats(), self.storage.iter_records()
+        return iter(self.stats.items()), iter(self.records.items())
 
     def save(self):
-        """Save stats from file as json."""
+        """Save stats from file as json, index and summarize them."""
         logger.warning(self.STAT_FILEPATH)
-        with open(self.STAT_FILEPATH, "w") as f:
-            json.dump(self.stats, f)
-        with open(self.RECORD_FILEPATH, "w") as f:
-            json.dump(self.records, f)
+        self.storage.save(self.stats, self.records)
+        index = ReportIndex(self.INDEX_FILEPATH)
+        sources = report_sources(self.storage)
+        index.build(*self._iter_saved(), sources=sources)
+
+        # the index keeps the last stats of keys written more than once
+        summary = summarize(index.iter_stats(), top=current_app.config.get(
+            'CDS_MIGRATOR_KIT_SUMMARY_TOP_VALUES', 20))
+        index.close()
+        with open(self.SUMMARY_FILEPATH, 'w') as f:
+            json.dump(summary, f, indent=2)
 
     def add_recid_to_stats(self, recid, **kwargs):
         """Add recid to stats."""
@@ -102,6 +185,23 @@ class JsonLogger(object):
         """Add record to list of collected records."""
         pass
 
+    def merge_stats(self, key, stats):
+        """Merge stats collected by another logger (f.e. in a worker).
+
+        :param key: key of the stats entry (recid).
+        :param stats: stats entry to merge or ``None`` if there are no stats
+            for this key.
+        """
+        if stats is None:
+            return
+        current = self.stats.setdefault(key, stats)
+        if current is stats:
+            return
+        for name, value in stats.items():
+            if isinstance(value, list):
+                current[name].extend(value)
+        current['clean'] = current['clean'] and stats['clean']
+
     def add_log(self, exc, key=None, value=None, output=None):
         """Add exception log."""
         self.resolve_error_type(exc, output, key, value)
@@ -152,9 +252,10 @@ class JsonLogger(object):
 class DocumentJsonLogger(JsonLogger):
     """Log document migration statistic to file controller."""
 
-    def __init__(self):
+    def __init__(self, storage=None):
         """Constructor."""
-        super().__init__('document_stats.json', 'document_records.json')
+        super().__init__('document_stats.json', 'document_records.json',
+                         storage=storage)
 
     def add_recid_to_stats(self, recid):
         """Add empty log item."""
@@ -176,15 +277,31 @@ class DocumentJsonLogger(JsonLogger):
 class MultipartJsonLogger(JsonLogger):
     """Log multipart statistics to file."""
 
-    def __init__(self):
+    def __init__(self, storage=None):
         """Constructor."""
-        super().__init__('multipart_stats.json', 'multipart_records.json')
+        super().__init__('multipart_stats.json', 'multipart_records.json',
+                         storage=storage)
         self.document_pid = 0
 
     def add_log(self, exc, key=None, value=None, output=None):
         """Add exception log."""
         self.resolve_error_type(exc, output, key, value)
 
+    def discard(self, keys):
+        """Remove the stats and records of loaded legacy records.
+
+        The documents created for their volumes are removed too, and new
+        documents are numbered after the remaining ones.
+        """
+        for key, stats in self.stats.items():
+            if str(key) in keys:
+                keys = keys | set(stats.get('volumes', ()))
+        super().discard(keys)
+        for key in self.records:
+            recid, _, number = str(key).partition('-doc-')
+            if number.isdigit():
+                self.document_pid = max(self.document_pid, int(number))
+
     def next_doc_pid(self):
         """Get the next available fake doc pid."""
         self.document_pid += 1
@@ -231,9 +348,14 @@ class MultipartJsonLogger(JsonLogger):
 class SerialJsonLogger(JsonLogger):
     """Log migration statistic to file controller."""
 
-    def __init__(self):
-        """Constructor."""
-        super().__init__('serial_stats.json', 'serial_records.json')
+    def __init__(self, storage=None, workers=1):
+        """Constructor.
+
+        :param workers: number of processes matching similar serials.
+        """
+        super().__init__('serial_stats.json', 'serial_records.json',
+                         storage=storage)
+        self.workers = workers
 
     def add_log(self, exc, key=None, value=None, output=None):
         """Add exception log."""
@@ -282,24 +404,56 @@ class SerialJsonLogger(JsonLogger):
                 self.stats[record['title']['title']]['documents']
 
     def _match_similar(self):
-        """Match similar serials."""
-        items = self.stats.items()
-        for title1, stat1 in items:
-            for title2, stat2 in items:
-                if title1 == title2:
-                    continue
-                if same_issn(stat1, stat2):
-                    if title2 not in stat1['similars']['same_issn']:
-                        stat1['similars']['same_issn'].append(title2)
-                    if title1 not in stat2['similars']['same_issn']:
-                        stat2['similars']['same_issn'].append(title1)
-                else:
-                    ratio = compare_titles(title1, title2)
-                    if 95 <= ratio < 100:
-                        if title2 not in stat1['similars']['similar_title']:
-                            stat1['similars']['similar_title'].append(title2)
-                        if title1 not in stat2['similars']['similar_title']:
-                            stat2['similars']['similar_title'].append(title1)
+        """Match similar serials.
+
+        Serials are matched by ISSN through a hash map and by title only for
+        the candidate pairs of ``similar_title_pairs``, scored in
+        ``self.workers`` processes. Matches are listed in the order of the
+        stats.
+        """
+        titles = list(self.stats)
+        same_issns = defaultdict(set)
+        similar_titles = defaultdict(set)
+
+        by_issn = defaultdict(list)
+        for i, title in enumerate(titles):
+            issn = self.stats[title]['issn']
+            if issn is not None:
+                by_issn[json.dumps(issn, sort_keys=True)].append(i)
+        for indexes in by_issn.values():
+            for i in indexes:
+                same_issns[i].update(indexes)
+                same_issns[i].discard(i)
+
+        candidates = defaultdict(list)
+        for i, j in similar_title_pairs(titles):
+            if j not in same_issns[i]:
+                candidates[i].append((j, titles[j]))
+        rows = [(i, titles[i], candidates[i]) for i in sorted(candidates)]
+        if self.workers > 1:
+            with multiprocessing.Pool(self.workers) as pool:
+                matches = list(chain.from_iterable(pool.imap_unordered(
+                    _match_titles, chunked(rows, 1000))))
+        else:
+            matches = _match_titles(rows)
+        # sets sorted below, the order in which workers finish is irrelevant
+        for i, j in matches:
+            similar_titles[i].add(j)
+            similar_titles[j].add(i)
+
+        for i, title in enumerate(titles):
+            similars = self.stats[title]['similars']
+            for key, found in (('same_issn', same_issns),
+                               ('similar_title', similar_titles)):
+                current = set(similars[key])
+                similars[key].extend(
+                    titles[j] for j in sorted(found.get(i, ()))
+                    if titles[j] not in current
+                )
+
+    def flush(self):
+        """Keep serials in memory, they are matched together on save."""
+        pass
 
     def save(self):
         """Save serials and update children and simliar matches."""
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015-2018 CERN.
+#
+# cds-migrator-kit is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""CDS Migrator Records MARCXML parsers."""
+
+from cds_dojson.marc21.utils import create_record
+from cds_dojson.utils import MementoDict
+from lxml import etree
+
+
+def _indicator(value):
+    """Normalize a MARC indicator as ``create_record`` does.
+
+    Blank indicators become ``_``, missing ones ``!``.
+    """
+    if value is None:
+        return '!'
+    if value in ('', '#'):
+        return '_'
+    return value.replace(' ', '_')
+
+
+class MarcXMLParser(object):
+    """Parse MARCXML records with a single lxml parser.
+
+    Builds the same ``MementoDict`` as ``create_record``, which tells the
+    fields not converted by the rules, without creating a new parser and
+    an intermediate document for each record.
+    """
+
+    def __init__(self, keep_singletons=True):
+        """Constructor.
+
+        :param keep_singletons: keep the fields and subfields without value.
+        """
+        self.keep_singletons = keep_singletons
+        self._parser = etree.XMLParser(recover=True)
+
+    def __call__(self, marcxml):
+        """Parse a MARCXML record.
+
+        :param marcxml: MARCXML of a record, as text or UTF-8 bytes.
+        :returns: ``MementoDict`` of the MARC fields, empty if nothing can be
+            parsed.
+        :raises ValueError: if the text declares its encoding.
+        """
+        if isinstance(marcxml, bytes):
+            marcxml = marcxml.decode('utf-8')
+        root = etree.fromstring(marcxml, self._parser)
+        record = []
+        if root is None:
+            return MementoDict(record)
+        keep_singletons = self.keep_singletons
+
+        for leader in root.iter('{*}leader'):
+            record.append(('leader', leader.text or ''))
+
+        for controlfield in root.iter('{*}controlfield'):
+            text = controlfield.text or ''
+            if text or keep_singletons:
+                record.append((controlfield.get('tag', '!'), text))
+
+        for datafield in root.iter('{*}datafield'):
+            key = '{0}{1}{2}'.format(datafield.get('tag', '!'),
+                                     _indicator(datafield.get('ind1')),
+                                     _indicator(datafield.get('ind2')))
+            fields = []
+            for subfield in datafield.iter('{*}subfield'):
+                text = subfield.text or ''
+                if text or keep_singletons:
+                    fields.append((subfield.get('code', '!'), text))
+            if fields or keep_singletons:
+                record.append((key, MementoDict(fields)))
+
+        return MementoDict(record)
+
+
+#: Parsers of the MARCXML of the records, by name.
+MARCXML_PARSERS = {
+    'default': lambda: create_record,
+    'lxml': MarcXMLParser,
+}
+
+
+def get_marcxml_parser(name=None):
+    """Get a MARCXML parser.
+
+    :param name: name of the parser (see ``MARCXML_PARSERS``), defaults to
+        ``create_record``.
+    """
+    return MARCXML_PARSERS[name or 'default']()
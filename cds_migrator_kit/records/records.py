@@ -22,11 +22,104 @@ from invenio_migrator.records import RecordDump
 
 from cds_migrator_kit.records.errors import LossyConversion
 from cds_migrator_kit.records.handlers import migration_exception_handler
-from cds_migrator_kit.records.utils import process_fireroles, update_access
+from cds_migrator_kit.records.utils import AccessCache, process_fireroles, \
+    update_access
 
 cli_logger = logging.getLogger('migrator')
 
 
+def collection_access(collections, cache=None):
+    """Calculate the value of the `_access` key from the record collections.
+
+    :param collections: ``collections`` of a legacy record dump.
+    :param cache: ``AccessCache`` reused across records.
+    """
+    if cache is not None:
+        read_access = cache.read_access(collections['restricted']) \
+            if collections else ()
+        return {'read': list(read_access)}
+
+    read_access = set()
+    if collections:
+        for coll, restrictions in collections['restricted'].items():
+            read_access.update(restrictions['users'])
+            read_access.update(process_fireroles(restrictions['fireroles']))
+        read_access.discard(None)
+
+    return {'read': list(read_access)}
+
+
+class CDSRecordConverter(object):
+    """Convert legacy records to JSON.
+
+    The model, logger and exception handlers are bound once, so that a
+    single converter converts all the records of a run.
+    """
+
+    def __init__(self, dojson_model=marc21, logger=None,
+                 source_type='marcxml', parse_marcxml=None):
+        """Initialize.
+
+        :param parse_marcxml: MARCXML parser of the records, defaults to
+            ``create_record`` (see ``get_marcxml_parser``).
+        """
+        self.dojson_model = dojson_model or marc21
+        self.parse_marcxml = parse_marcxml or create_record
+        self.logger = logger
+        self.source_type = source_type
+        self.access_cache = AccessCache()
+        handler = migration_exception_handler(logger)
+        self.exception_handlers = {
+            UnexpectedValue: handler,
+            MissingRequiredField: handler,
+            ManualMigrationRequired: handler,
+        }
+
+    def convert_revision(self, data, access):
+        """Convert a revision of a record to JSON.
+
+        :param data: revision of a legacy record dump.
+        :param access: ``_access`` of the record, see ``collection_access``.
+        :returns: ``(modification datetime, JSON)`` tuple.
+        """
+        dt = arrow.get(data['modification_datetime']).datetime
+
+        if self.source_type == 'marcxml':
+            marc_record = self.parse_marcxml(data['marcxml'])
+            try:
+                val = self.dojson_model.do(
+                    marc_record, exception_handlers=self.exception_handlers)
+                missing = self.dojson_model.missing(marc_record)
+                if missing:
+                    raise LossyConversion(missing=missing)
+                update_access(val, access)
+                return dt, val
+            except LossyConversion as e:
+                raise e
+            except Exception as e:
+                current_app.logger.error(
+                    'Impossible to convert to JSON {0} - {1}'.format(
+                        e, marc_record))
+                raise e
+        else:
+            val = data['json']
+
+            # Calculate the _access key
+            update_access(val, access)
+            return dt, val
+
+    def convert(self, data):
+        """Convert the final revision of a legacy record dump to JSON.
+
+        Unlike ``CDSRecordDump.prepare_revisions``, the intermediate
+        revisions are left untouched.
+        """
+        cli_logger.info('\n=====#RECID# %s INIT=====\n', data['recid'])
+        return self.convert_revision(
+            data['record'][-1],
+            collection_access(data['collections'], self.access_cache))[1]
+
+
 class CDSRecordDump(RecordDump):
     """CDS record dump class."""
 
@@ -36,12 +129,20 @@ class CDSRecordDump(RecordDump):
                  latest_only=False,
                  pid_fetchers=None,
                  dojson_model=marc21,
-                 logger=None):
-        """Initialize."""
+                 logger=None,
+                 converter=None):
+        """Initialize.
+
+        :param converter: ``CDSRecordConverter`` of the final revision,
+            created for this dump if not given.
+        """
         super().__init__(data, source_type, latest_only, pid_fetchers,
                          dojson_model)
         self.logger = logger
-        cli_logger.info('\n=====#RECID# {0} INIT=====\n'.format(data['recid']))
+        self.converter = converter or CDSRecordConverter(
+            dojson_model=self.dojson_model, logger=logger,
+            source_type=source_type)
+        cli_logger.info('\n=====#RECID# %s INIT=====\n', data['recid'])
 
     @property
     def collection_access(self):
@@ -51,16 +152,7 @@ class CDSRecordDump(RecordDump):
         calculate the value of this key at the moment of the dump, therefore
         only the access rights are correct for the last version.
         """
-        read_access = set()
-        if self.data['collections']:
-            for coll, restrictions in \
-                    self.data['collections']['restricted'].items():
-                read_access.update(restrictions['users'])
-                read_access.update(
-                    process_fireroles(restrictions['fireroles']))
-            read_access.discard(None)
-
-        return {'read': list(read_access)}
+        return collection_access(self.data['collections'])
 
     def _prepare_intermediate_revision(self, data):
         """Convert intermediate versions to marc into JSON."""
@@ -82,36 +174,7 @@ class CDSRecordDump(RecordDump):
         return dt, val
 
     def _prepare_final_revision(self, data):
-        dt = arrow.get(data['modification_datetime']).datetime
-
-        exception_handlers = {
-            UnexpectedValue: migration_exception_handler(self.logger),
-            MissingRequiredField: migration_exception_handler(self.logger),
-            ManualMigrationRequired: migration_exception_handler(self.logger),
-        }
-        if self.source_type == 'marcxml':
-            marc_record = create_record(data['marcxml'])
-            try:
-                val = self.dojson_model.do(
-                    marc_record, exception_handlers=exception_handlers)
-                missing = self.dojson_model.missing(marc_record)
-                if missing:
-                    raise LossyConversion(missing=missing)
-                update_access(val, self.collection_access)
-                return dt, val
-            except LossyConversion as e:
-                raise e
-            except Exception as e:
-                current_app.logger.error(
-                    'Impossible to convert to JSON {0} - {1}'.format(
-                        e, marc_record))
-                raise e
-        else:
-            val = data['json']
-
-            # Calculate the _access key
-            update_access(val, self.collection_access)
-            return dt, val
+        return self.converter.convert_revision(data, self.collection_access)
 
     def prepare_revisions(self):
         """Prepare data.
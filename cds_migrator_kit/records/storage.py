@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015-2018 CERN.
+#
+# cds-migrator-kit is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""CDS Migrator Records loggers storage."""
+
+import json
+import os
+
+
+class JsonStorage(object):
+    """Store stats and records as two JSON documents, written on save."""
+
+    #: Whether stats and records are written as they are produced, with
+    #: ``append`` and ``resume`` (only implemented by incremental storages).
+    incremental = False
+
+    def __init__(self, stats_filepath, records_filepath):
+        """Constructor."""
+        self.stats_filepath = stats_filepath
+        self.records_filepath = records_filepath
+
+    def exists(self):
+        """Check if the stats and records files exist."""
+        return os.path.exists(self.stats_filepath) and \
+            os.path.exists(self.records_filepath)
+
+    def load(self):
+        """Load stats and records."""
+        with open(self.stats_filepath, 'r') as f:
+            stats = json.load(f)
+        with open(self.records_filepath, 'r') as f:
+            records = json.load(f)
+        return stats, records
+
+    def iter_stats(self):
+        """Iterate over the ``(key, stats)`` pairs."""
+        with open(self.stats_filepath, 'r') as f:
+            return iter(json.load(f).items())
+
+    def iter_records(self):
+        """Iterate over the ``(key, record)`` pairs."""
+        with open(self.records_filepath, 'r') as f:
+            return iter(json.load(f).items())
+
+    def save(self, stats, records):
+        """Save stats and records."""
+        with open(self.stats_filepath, 'w') as f:
+            json.dump(stats, f)
+        with open(self.records_filepath, 'w') as f:
+            json.dump(records, f)
+
+
+class JsonLinesStorage(JsonStorage):
+    """Append stats and records to JSON Lines files as they are produced.
+
+    Each line holds a ``[key, value]`` pair. When a key is written more than
+    once, the last line wins.
+    """
+
+    incremental = True
+
+    def __init__(self, stats_filepath, records_filepath):
+        """Constructor."""
+        super().__init__(
+            '{0}.jsonl'.format(os.path.splitext(stats_filepath)[0]),
+            '{0}.jsonl'.format(os.path.splitext(records_filepath)[0]),
+        )
+        self._files = None
+
+    @staticmethod
+    def _iter(filepath):
+        """Iterate over the ``[key, value]`` pairs of a file."""
+        with open(filepath, 'r') as f:
+            for line in f:
+                # skip a line truncated by an interruption
+                if line.endswith('\n'):
+                    key, value = json.loads(line)
+                    yield str(key), value
+
+    def iter_stats(self):
+        """Iterate over the ``(key, stats)`` pairs, as written."""
+        return self._iter(self.stats_filepath)
+
+    def iter_records(self):
+        """Iterate over the ``(key, record)`` pairs, as written."""
+        return self._iter(self.records_filepath)
+
+    def load(self):
+        """Load stats and records."""
+        return dict(self.iter_stats()), dict(self.iter_records())
+
+    @staticmethod
+    def _truncate_partial_line(filepath):
+        """Remove a last line truncated by an interruption."""
+        with open(filepath, 'rb+') as f:
+            end = f.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                step = min(position, 64 * 1024)
+                f.seek(position - step)
+                chunk = f.read(step)
+                newline = chunk.rfind(b'\n')
+                if newline >= 0:
+                    position = position - step + newline + 1
+                    break
+                position -= step
+            if position < end:
+                f.truncate(position)
+
+    def _open(self, mode):
+        """Open the stats and records files."""
+        self._files = (open(self.stats_filepath, mode),
+                       open(self.records_filepath, mode))
+
+    def resume(self):
+        """Resume appending to the files of an interrupted run.
+
+        :returns: set of the keys (as strings) of the stats already written.
+        """
+        keys = set()
+        if self.exists():
+            for filepath in (self.stats_filepath, self.records_filepath):
+                self._truncate_partial_line(filepath)
+            with open(self.stats_filepath, 'r') as f:
+                for line in f:
+                    keys.add(str(json.loads(line)[0]))
+        self._open('a')
+        return keys
+
+    def append(self, stats, records):
+        """Append stats and records."""
+        if self._files is None:
+            self._open('w')
+        stats_file, records_file = self._files
+        # stats are written last, a stats line marks its record as done
+        for data, f in ((records, records_file), (stats, stats_file)):
+            for key, value in data.items():
+                f.write(json.dumps([key, value]))
+                f.write('\n')
+            f.flush()
+
+    def save(self, stats, records):
+        """Append the remaining stats and records and close the files."""
+        self.append(stats, records)
+        for f in self._files:
+            f.close()
+        self._files = None
+
+
+#: Available storages of the migration stats and records.
+STORAGES = {
+    'json': JsonStorage,
+    'jsonl': JsonLinesStorage,
+}
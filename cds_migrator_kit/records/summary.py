@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015-2018 CERN.
+#
+# cds-migrator-kit is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""CDS Migrator Records report summary."""
+
+import json
+import re
+from collections import Counter
+
+from cds_migrator_kit.records.index import ERROR_CATEGORIES, iter_errors
+
+
+def normalize_message(message):
+    """Normalize an error message so that similar messages are counted once.
+
+    Numbers are replaced by ``#`` and the details following a colon (f.e.
+    the missing fields of a lossy conversion) are dropped.
+    """
+    if not message:
+        return ''
+    message = message.split(':', 1)[0]
+    return re.sub(r'\d+', '#', message).strip()
+
+
+def summarize(stats, top=20):
+    """Summarize the errors of the stats entries of a report.
+
+    :param stats: iterable of ``(key, stats)``.
+    :param top: number of most frequent offending values listed.
+    :returns: dict with the number of records and clean records, and the
+        number of errors per category, per MARC key and subfield, and per
+        normalized message, most frequent first.
+    """
+    total = clean = 0
+    categories = Counter()
+    category_records = Counter()
+    fields = Counter()
+    messages = Counter()
+    values = Counter()
+    for _, entry in stats:
+        total += 1
+        if entry.get('clean'):
+            clean += 1
+        for category in ERROR_CATEGORIES:
+            if entry.get(category):
+                category_records[category] += 1
+        for category, key, subfield, value, message in iter_errors(entry):
+            categories[category] += 1
+            fields[category, key, subfield] += 1
+            messages[category, normalize_message(message)] += 1
+            if value is not None:
+                values[category, key, subfield, value] += 1
+
+    return {
+        'records': total,
+        'clean': clean,
+        'categories': {
+            category: dict(errors=categories[category],
+                           records=category_records[category])
+            for category in ERROR_CATEGORIES
+        },
+        'fields': [
+            dict(category=category, key=key, subfield=subfield, count=count)
+            for (category, key, subfield), count in fields.most_common()
+        ],
+        'messages': [
+            dict(category=category, message=message, count=count)
+            for (category, message), count in messages.most_common()
+        ],
+        'values': [
+            dict(category=category, key=key, subfield=subfield,
+                 value=json.loads(value), count=count)
+            for (category, key, subfield, value), count
+            in values.most_common(top)
+        ],
+    }
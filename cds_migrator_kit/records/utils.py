@@ -7,41 +7,59 @@
 # under the terms of the MIT License; see LICENSE file for more details.
 
 """CDS Migrator Records utils."""
+import bz2
 import copy
+import gzip
 import json
+import lzma
 import os
 import re
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+from itertools import islice
 
 from flask import current_app
 from fuzzywuzzy import fuzz
 
+try:
+    from rapidfuzz.distance import Indel
+    from rapidfuzz.process import cdist
+except ImportError:
+    cdist = None
+
+
+def process_fireroles(fireroles, warnings=None):
+    """Extract firerole definitions.
+
+    :param warnings: ``Counter`` of the rules which can not be migrated. If
+        given, the rules are counted there instead of being logged.
+    """
+    def warn(message):
+        if warnings is None:
+            current_app.logger.warning(message)
+        else:
+            warnings[message] += 1
 
-def process_fireroles(fireroles):
-    """Extract firerole definitions."""
     rigths = set()
     for firerole in fireroles:
         for (allow, not_, field, expressions_list) in firerole[1]:
             if not allow:
-                current_app.logger.warning(
-                    'Not possible to migrate deny rules: {0}.'.format(
-                        expressions_list))
+                warn('Not possible to migrate deny rules: {0}.'.format(
+                    expressions_list))
                 continue
             if not_:
-                current_app.logger.warning(
-                    'Not possible to migrate not rules: {0}.'.format(
-                        expressions_list))
+                warn('Not possible to migrate not rules: {0}.'.format(
+                    expressions_list))
                 continue
             if field in ('remote_ip', 'until', 'from'):
-                current_app.logger.warning(
-                    'Not possible to migrate {0} rule: {1}.'.format(
-                        field, expressions_list))
+                warn('Not possible to migrate {0} rule: {1}.'.format(
+                    field, expressions_list))
                 continue
             # We only deal with allow group rules
             for reg, expr in expressions_list:
                 if reg:
-                    current_app.logger.warning(
-                        'Not possible to migrate groups based on regular'
-                        ' expressions: {0}.'.format(expr))
+                    warn('Not possible to migrate groups based on regular'
+                         ' expressions: {0}.'.format(expr))
                     continue
                 clean_name = expr[
                     :-len(' [CERN]')].lower().strip().replace(' ', '-')
@@ -49,6 +67,50 @@ def process_fireroles(fireroles):
     return rigths
 
 
+class AccessCache(object):
+    """Memoize the read access of the restricted collections of records.
+
+    Records sharing the same restricted collections share their access, so
+    that their fireroles are processed once. The rules which can not be
+    migrated are logged once and counted per record in ``warnings``.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        self.warnings = Counter()
+        self._access = {}
+        self._logged = set()
+
+    def read_access(self, restricted):
+        """Get the read access of restricted collections.
+
+        :param restricted: ``restricted`` collections of a legacy record.
+        :returns: frozenset of users and groups allowed to read.
+        """
+        key = json.dumps(restricted, sort_keys=True)
+        cached = self._access.get(key)
+        if cached is None:
+            access, warnings = set(), Counter()
+            for restrictions in restricted.values():
+                access.update(restrictions['users'])
+                access.update(
+                    process_fireroles(restrictions['fireroles'], warnings))
+            access.discard(None)
+            for message in warnings:
+                if message not in self._logged:
+                    self._logged.add(message)
+                    current_app.logger.warning(message)
+            cached = self._access[key] = (frozenset(access), warnings)
+        access, warnings = cached
+        self.warnings.update(warnings)
+        return access
+
+    def pop_warnings(self):
+        """Get the warnings counted so far and reset them."""
+        warnings, self.warnings = self.warnings, Counter()
+        return warnings
+
+
 def update_access(data, *access):
     """Merge access rights information.
 
@@ -78,6 +140,201 @@ def compare_titles(title1, title2):
     return fuzz.ratio(title1, title2)
 
 
+def compare_titles_bulk(title, titles):
+    """Return the ratios of the fuzzy comparisons of a title with many titles.
+
+    The ratios are the same as the ones of ``compare_titles``. If
+    ``rapidfuzz`` is installed, the distances to all the titles are computed
+    at once in an array instead of one by one. Ratios exactly halfway
+    between two integers are still computed by ``compare_titles``, since
+    ``python-Levenshtein`` rounds them up or down depending on its version.
+
+    :param title: title to compare.
+    :param titles: list of titles to compare ``title`` with.
+    :returns: list of ratios, in the order of ``titles``.
+    """
+    if cdist is None or not titles:
+        return [compare_titles(title, other) for other in titles]
+    distances = cdist([title], titles, scorer=Indel.distance)[0]
+    ratios = []
+    for other, distance in zip(titles, distances):
+        length = len(title) + len(other)
+        if not length:
+            ratios.append(100)
+            continue
+        similarity = length - int(distance)
+        if 200 * similarity % (2 * length) == length:
+            ratios.append(compare_titles(title, other))
+        else:
+            ratios.append(int(round(100 * similarity / length)))
+    return ratios
+
+
+def similar_title_pairs(titles, min_ratio=95, q=3):
+    """Find the pairs of titles which might be similar.
+
+    The pairs returned are a superset of the pairs for which
+    ``compare_titles`` is at least ``min_ratio``: the ratio is bound by the
+    indel distance of the titles, which in turn is bound by their lengths and
+    by the number of q-grams they share. Only titles sharing one of their
+    rarest q-grams (prefix filtering) or short enough to share none are
+    paired, instead of pairing every title with every other title.
+
+    :param titles: list of titles.
+    :param min_ratio: minimum ratio of similar titles.
+    :param q: length of the q-grams.
+    :returns: set of ``(i, j)`` pairs of indexes in ``titles``, ``i < j``.
+    """
+    # ratio = (len1 + len2 - distance) / (len1 + len2) once rounded is at
+    # least min_ratio only if 200 * distance <= slack * (len1 + len2)
+    slack = 201 - 2 * min_ratio
+    if slack <= 0:
+        return set()
+    # the length difference is a lower bound of the distance
+    max_length = [len(title) * (200 + slack) // (200 - slack)
+                  for title in titles]
+    max_distance = [slack * (len(title) + max_length[i]) // 200
+                    for i, title in enumerate(titles)]
+
+    # q-grams numbered by occurrence, so that they can be used as sets
+    grams = []
+    frequency = defaultdict(int)
+    for title in titles:
+        occurrences = defaultdict(int)
+        title_grams = []
+        for start in range(len(title) - q + 1):
+            gram = title[start:start + q]
+            title_grams.append((gram, occurrences[gram]))
+            occurrences[gram] += 1
+        for gram in title_grams:
+            frequency[gram] += 1
+        grams.append(title_grams)
+
+    by_length = sorted(range(len(titles)), key=lambda i: len(titles[i]))
+    lengths = [len(titles[i]) for i in by_length]
+
+    pairs = set()
+    index = defaultdict(list)
+    for i, title_grams in enumerate(grams):
+        # an edit operation changes at most q q-grams
+        min_common = len(title_grams) - q * max_distance[i]
+        if min_common <= 0:
+            # might share no q-gram with a similar title: pair it with all
+            # the titles of compatible length
+            start = bisect_left(lengths, len(titles[i]) * (200 - slack) /
+                                (200 + slack))
+            end = bisect_right(lengths, max_length[i])
+            pairs.update((min(i, j), max(i, j))
+                         for j in by_length[start:end] if j != i)
+            continue
+        title_grams.sort(key=lambda gram: (frequency[gram], gram))
+        candidates = set()
+        for gram in title_grams[:len(title_grams) - min_common + 1]:
+            candidates.update(index[gram])
+            index[gram].append(i)
+        pairs.update((j, i) for j in candidates
+                     if abs(len(titles[i]) - len(titles[j])) * 200 <=
+                     slack * (len(titles[i]) + len(titles[j])))
+    return pairs
+
+
+#: Openers of compressed dumps, by file extension.
+DUMP_OPENERS = {
+    '.bz2': bz2.open,
+    '.gz': gzip.open,
+    '.xz': lzma.open,
+}
+
+
+def open_dump(path):
+    """Open a legacy dump for reading as UTF-8 text.
+
+    Compressed dumps are decompressed on the fly and invalid UTF-8 sequences
+    are replaced while reading, so the dump itself is never modified.
+
+    :param path: path to the dump, optionally ending with a compression
+        extension (see ``DUMP_OPENERS``).
+    """
+    extension = os.path.splitext(path)[1].lower()
+    opener = DUMP_OPENERS.get(extension, open)
+    return opener(path, 'rt', encoding='utf-8', errors='replace')
+
+
+def iter_json_array(fp, chunk_size=1024 * 1024):
+    """Iterate over the items of a top-level JSON array in a file.
+
+    Items are decoded and yielded one by one, so that only the item being
+    parsed (and not the whole array) is kept in memory.
+
+    :param fp: file-like object opened in text mode.
+    :param chunk_size: number of characters read from ``fp`` at once.
+    """
+    decoder = json.JSONDecoder()
+    whitespace = ' \t\n\r'
+    delimiters = set(whitespace + ',]')
+    buf = fp.read(chunk_size)
+    pos = 0
+    eof = not buf
+
+    def skip_whitespace():
+        nonlocal buf, pos, eof
+        while True:
+            while pos < len(buf) and buf[pos] in whitespace:
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            buf, pos = fp.read(chunk_size), 0
+            eof = not buf
+
+    skip_whitespace()
+    if buf[pos:pos + 1] != '[':
+        raise ValueError('Expected a JSON array at the top level.')
+    pos += 1
+    skip_whitespace()
+    if buf[pos:pos + 1] == ']':
+        return
+
+    while True:
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+            # a value not followed by a delimiter might be truncated
+            if not eof and buf[end:end + 1] not in delimiters:
+                raise ValueError
+        except ValueError:
+            if eof:
+                raise
+            # grow the buffer geometrically to keep big items linear
+            more = fp.read(max(chunk_size, len(buf) - pos))
+            eof = not more
+            buf = buf[pos:] + more
+            pos = 0
+            continue
+        pos = end
+        yield item
+
+        skip_whitespace()
+        char = buf[pos:pos + 1]
+        pos += 1
+        if char == ']':
+            return
+        if char != ',':
+            raise ValueError(
+                'Expected "," or "]" after array item, got {0!r}.'.format(
+                    char))
+        skip_whitespace()
+        if pos >= chunk_size:
+            buf, pos = buf[pos:], 0
+
+
+def chunked(iterable, size):
+    """Split an iterable in lists of at most ``size`` items."""
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
 def clean_exception_message(message):
     """Cleanup exception message."""
     match = re.match(r'^(\[[^\]]*\])?(.*)$', message)
@@ -11,11 +11,14 @@
 from __future__ import absolute_import, print_function
 
 import logging
+import os
 
-from flask import Blueprint, abort, current_app, jsonify, render_template
+from flask import Blueprint, Response, abort, current_app, jsonify, \
+    render_template, request, send_file
 
 from cds_migrator_kit.config import CDS_MIGRATOR_KIT_LOGS_PATH
 
+from .index import ERROR_CATEGORIES, ReportCache
 from .log import JsonLogger
 
 cli_logger = logging.getLogger('migrator')
@@ -43,33 +46,166 @@ def results():
     return render_template("cds_migrator_kit_records/index.html", rectype=None)
 
 
+#: Reports cache of the current process, see ``_get_index``.
+_report_cache = None
+
+
+def _get_index(rectype):
+    """Get the (cached) index of the report of a rectype."""
+    global _report_cache
+    if _report_cache is None:
+        _report_cache = ReportCache(
+            current_app.config['CDS_MIGRATOR_KIT_RESULTS_CACHE_SIZE'])
+    return _report_cache.index(JsonLogger.get_json_logger(rectype))
+
+
+def _get_index_or_404(rectype):
+    """Get the index of the report of a rectype or abort if missing."""
+    try:
+        return _get_index(rectype)
+    except FileNotFoundError:
+        abort(404)
+
+
+def _pagination():
+    """Get the requested page number and size."""
+    page = max(request.args.get('page', 1, type=int), 1)
+    size = request.args.get(
+        'size', current_app.config['CDS_MIGRATOR_KIT_RESULTS_PAGE_SIZE'],
+        type=int)
+    return page, min(max(size, 1),
+                     current_app.config['CDS_MIGRATOR_KIT_RESULTS_MAX_SIZE'])
+
+
 @blueprint.route("/results/<rectype>")
 def results_rectype(rectype=None):
-    """Render a basic view."""
+    """Render a page of the results of a rectype."""
     try:
-        logger = JsonLogger.get_json_logger(rectype)
-        logger.load()
-        template = "cds_migrator_kit_records/{}.html".format(rectype)
+        index = _get_index(rectype)
     except FileNotFoundError:
-        template = "cds_migrator_kit_records/rectype_missing.html"
+        return render_template(
+            "cds_migrator_kit_records/rectype_missing.html", rectype=rectype)
 
+    page, size = _pagination()
+    total = index.count()
     return render_template(
-        template,
-        stats_sorted_by_key=[
-            logger.stats[stat]
-            for stat in sorted(logger.stats.keys())
-        ],
-        stats=logger.stats,
-        records=logger.records,
-        rectype=rectype
+        "cds_migrator_kit_records/{}.html".format(rectype),
+        stats_sorted_by_key=index.page(page, size),
+        stats=index.stats,
+        records=index.records,
+        rectype=rectype,
+        page=page,
+        size=size,
+        total=total,
+        pages=max(-(-total // size), 1),
+    )
+
+
+@blueprint.route("/stats/<rectype>")
+def stats_rectype(rectype):
+    """Serve a page of the stats of a rectype, sorted by key."""
+    index = _get_index_or_404(rectype)
+
+    page, size = _pagination()
+    return jsonify(
+        total=index.count(),
+        page=page,
+        size=size,
+        hits=index.page(page, size),
+    )
+
+
+def _error_category():
+    """Get the requested error category."""
+    category = request.args.get('category')
+    if category is not None and category not in ERROR_CATEGORIES:
+        abort(400)
+    return category
+
+
+@blueprint.route("/stats/<rectype>/errors")
+def errors_rectype(rectype):
+    """Serve a page of the errors of a rectype.
+
+    Errors are filtered by ``category``, MARC ``key`` and ``subfield``.
+    """
+    index = _get_index_or_404(rectype)
+    page, size = _pagination()
+    return jsonify(
+        page=page,
+        size=size,
+        hits=index.errors(
+            category=_error_category(),
+            key=request.args.get('key'),
+            subfield=request.args.get('subfield'),
+            page=page,
+            size=size,
+        ),
     )
 
 
+@blueprint.route("/stats/<rectype>/errors/count")
+def errors_count_rectype(rectype):
+    """Serve the number of errors of a rectype per MARC key.
+
+    Errors are filtered by ``category`` and counted per subfield too if
+    ``by_subfield`` is set.
+    """
+    index = _get_index_or_404(rectype)
+    return jsonify(hits=index.count_errors(
+        category=_error_category(),
+        by_subfield=request.args.get('by_subfield', '').lower() in (
+            '1', 'true', 'yes'),
+    ))
+
+
+@blueprint.route("/stats/<rectype>/dirty")
+def dirty_rectype(rectype):
+    """Serve a page of the recids of a rectype which are not clean."""
+    index = _get_index_or_404(rectype)
+    page, size = _pagination()
+    return jsonify(page=page, size=size, hits=index.dirty(page, size))
+
+
+@blueprint.route("/stats/<rectype>/summary")
+def summary_rectype(rectype):
+    """Serve the errors summary of the report of a rectype."""
+    logger = JsonLogger.get_json_logger(rectype)
+    if not os.path.exists(logger.SUMMARY_FILEPATH):
+        abort(404)
+    return send_file(os.path.abspath(logger.SUMMARY_FILEPATH),
+                     mimetype='application/json')
+
+
+def _export_status():
+    """Get the requested status of the exported records."""
+    status = request.args.get('status')
+    if status not in (None, 'clean', 'dirty'):
+        abort(400)
+    return None if status is None else status == 'clean'
+
+
+@blueprint.route("/export/<rectype>")
+def export_rectype(rectype):
+    """Stream the converted records of a rectype as JSON Lines.
+
+    Records are filtered by legacy recid range (``start`` and ``end``) and
+    ``status`` (``clean`` or ``dirty``).
+    """
+    index = _get_index_or_404(rectype)
+    chunks = index.export(
+        start=request.args.get('start', type=int),
+        end=request.args.get('end', type=int),
+        clean=_export_status(),
+        chunk_size=current_app.config['CDS_MIGRATOR_KIT_EXPORT_CHUNK_SIZE'],
+    )
+    return Response(chunks, mimetype='application/x-ndjson')
+
+
 @blueprint.route('/record/<rectype>/<recid>')
 def send_json(rectype, recid):
     """Serves static json preview output files."""
-    logger = JsonLogger.get_json_logger(rectype)
-    logger.load()
-    if recid not in logger.records:
+    record = _get_index_or_404(rectype).records.get(recid)
+    if record is None:
         abort(404)
-    return jsonify(logger.records[recid])
+    return jsonify(record)
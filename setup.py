@@ -30,6 +30,10 @@ extras_require = {
     'docs': [
         'Sphinx>=1.5.1',
     ],
+    'rapidfuzz': [
+        'numpy>=1.13.0',
+        'rapidfuzz>=2.0.0',
+    ],
     'tests': tests_require,
 }
 
@@ -55,6 +59,7 @@ install_requires = [
     'invenio-pidstore>=1.0.0',
     'invenio-records>=1.0.0',
     'invenio-records-files>=1.0.0a10',
+    'lxml>=3.5.0',
     'pathlib>=1.0.1',
     'importlib-metadata==0.18',
     'pluggy==0.11.0',
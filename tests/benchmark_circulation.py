@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015-2018 CERN.
+#
+# cds-migrator-kit is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""CDS Migrator Circulation microbenchmarks.
+
+Run with ``python -m tests.benchmark_circulation``.
+"""
+
+import timeit
+from datetime import datetime
+
+from cds_migrator_kit.circulation.utils import LEGACY_DATE_FORMAT, \
+    legacy_date_isoformat
+
+
+def benchmark_legacy_dates(items=10000, timestamps=100, number=3):
+    """Time converting the dates of items sharing a few timestamps.
+
+    :returns: ``(legacy_date_isoformat, strptime)`` timings, in seconds.
+    """
+    dates = ['2016-01-{0:02}T17:28:{1:02}'.format(
+        1 + i % timestamps // 60, i % timestamps % 60) for i in range(items)]
+
+    def fast():
+        legacy_date_isoformat.cache_clear()
+        return [legacy_date_isoformat(date) for date in dates]
+
+    def slow():
+        return [datetime.strptime(date, LEGACY_DATE_FORMAT).isoformat()
+                for date in dates]
+
+    return (timeit.timeit(fast, number=number),
+            timeit.timeit(slow, number=number))
+
+
+if __name__ == '__main__':
+    fast, slow = benchmark_legacy_dates()
+    print('legacy_date_isoformat: {0:.4f}s, strptime: {1:.4f}s'.format(
+        fast, slow))
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015-2018 CERN.
+#
+# cds-migrator-kit is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""CDS Migrator Records conversion cache tests."""
+
+import time
+
+from cds_migrator_kit.records.cache import ConversionCache, rules_fingerprint
+
+
+def _item(marcxml, collections=None):
+    """Build a legacy record dump."""
+    return {'recid': 1, 'collections': collections,
+            'record': [{'marcxml': '<record/>'}, {'marcxml': marcxml}]}
+
+
+def test_conversion_cache(tmpdir):
+    """Test caching converted records by content."""
+    filepath = str(tmpdir.join('cache.sqlite'))
+    cache = ConversionCache(filepath, ['document', 'rules'], max_size=1000)
+    key = cache.key(_item('<record>a</record>'))
+
+    assert cache.key(_item('<record>a</record>')) == key
+    assert cache.key(_item('<record>b</record>')) != key
+    assert cache.key(_item('<record>a</record>', {'restricted': {}})) != key
+    other = ConversionCache(filepath, ['document', 'other'], max_size=1000)
+    assert other.key(_item('<record>a</record>')) != key
+
+    assert cache.get(key) is None
+    cache.set(key, {'recid': 1, 'clean': True}, {'recid': 1})
+    assert cache.get(key) == ({'recid': 1, 'clean': True}, {'recid': 1})
+    cache.set('lossy', {'recid': 2, 'clean': False}, None)
+    assert cache.get('lossy') == ({'recid': 2, 'clean': False}, None)
+    cache.close()
+
+
+def test_conversion_cache_evict(tmpdir):
+    """Test evicting the least recently used entries."""
+    cache = ConversionCache(str(tmpdir.join('cache.sqlite')), [], max_size=0)
+    record = {'title': 'x' * 100}
+    for key in ('a', 'b', 'c'):
+        cache.set(key, None, record)
+        time.sleep(0.01)
+    cache.get('a')
+    cache.max_size = cache.size() - 1
+
+    assert cache.evict() == 1
+    assert cache.get('b') is None
+    assert cache.get('a') and cache.get('c')
+    assert cache.evict() == 0
+
+
+def test_conversion_cache_used(tmpdir):
+    """Test writing the use of the entries in batches."""
+    cache = ConversionCache(str(tmpdir.join('cache.sqlite')), [],
+                            max_size=0, batch_size=2)
+    for key in ('a', 'b', 'c'):
+        cache.set(key, None, {})
+    time.sleep(0.01)
+
+    def used():
+        return dict(cache.connection.execute('SELECT key, used FROM entries'))
+
+    before = used()
+    cache.get('a')
+    assert used() == before
+    cache.get('b')
+    assert used()['a'] > before['a'] and used()['b'] > before['b']
+
+    cache.get('c')
+    assert cache.pop_used() == ['c']
+    cache.touch(['c', 'a'])
+    assert used()['c'] > before['c']
+    cache.close()
+
+
+def test_rules_fingerprint():
+    """Test fingerprinting the conversion rules."""
+    assert rules_fingerprint('cds_migrator_kit') == \
+        rules_fingerprint('cds_migrator_kit')
+    assert rules_fingerprint('cds_migrator_kit') != rules_fingerprint()
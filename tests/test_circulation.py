@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015-2018 CERN.
+#
+# cds-migrator-kit is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""CDS Migrator Circulation tests."""
+
+import json
+import os
+from datetime import datetime
+
+import pytest
+from sqlalchemy import JSON, Column, ForeignKey, Integer, String, create_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from cds_migrator_kit.circulation.items.cli import items
+from cds_migrator_kit.circulation.pids import PidAllocator
+from cds_migrator_kit.circulation.users.cli import _bulk_import_users
+from cds_migrator_kit.circulation.utils import RejectionLog, \
+    legacy_date_isoformat
+
+INTERNAL_LOCATIONS = [{'internal_location_pid': '1', 'legacy_id': '3'}]
+
+
+def _item(barcode, **kwargs):
+    """Build a legacy item."""
+    item = {
+        'barcode': barcode,
+        'id_bibrec': 1,
+        'id_crcLIBRARY': '3',
+        'location': 'shelf',
+        'description': '',
+        'loan_period': '4 weeks',
+        'status': 'on shelf',
+        'creation_date': '2016-01-29T17:28:17',
+        'modification_date': '2016-01-29T17:28:17',
+    }
+    item.update(kwargs)
+    return item
+
+
+def test_items(base_app, tmpdir):
+    """Test migrating items dumps in parallel to JSON Lines."""
+    dumps = tmpdir.mkdir('items')
+    dumps.join('a.json').write(json.dumps([
+        _item('A1'), _item(None), _item('A3', status='lost'),
+    ]))
+    dumps.join('b.json').write(json.dumps([
+        _item('B1', creation_date=None), _item('B2', id_crcLIBRARY='4'),
+    ]))
+    locations = tmpdir.join('locations.json')
+    locations.write(json.dumps({'internal_locations': INTERNAL_LOCATIONS}))
+
+    with base_app.app_context():
+        for workers in (1, 2):
+            items(str(dumps), str(locations), workers=workers)
+            logs_path = base_app.config['CDS_MIGRATOR_KIT_LOGS_PATH']
+            records = []
+            for i in (0, 1):
+                with open(os.path.join(logs_path,
+                                       'items_{0}.jsonl'.format(i))) as fp:
+                    records.extend(json.loads(line) for line in fp)
+            assert [(record['barcode'], record['item_pid'])
+                    for record in records] == [('A1', '1'), ('B1', '1000001')]
+
+            with open(os.path.join(logs_path, 'items_summary.json')) as fp:
+                assert json.load(fp) == dict(
+                    total=5, migrated=2,
+                    rejected=dict(barcode=1, status=1, library=1),
+                    missing_dates=dict(creation_date=1))
+            with open(os.path.join(logs_path,
+                                   'items_0_rejected.jsonl')) as fp:
+                assert [json.loads(line) for line in fp] == [
+                    dict(reason='barcode', barcode=None, id_bibrec=1),
+                    dict(reason='status', barcode='A3', id_bibrec=1,
+                         value='lost'),
+                ]
+
+
+def test_pid_allocator():
+    """Test reserving ranges of PIDs per shard."""
+    allocator = PidAllocator(10, first_pid=5)
+    assert allocator.reserve(0)[0] == '5'
+    assert allocator.reserve(2)[9] == '34'
+    with pytest.raises(ValueError):
+        allocator.reserve(1)[10]
+
+
+def test_legacy_date_isoformat():
+    """Test converting legacy dates as ``strptime`` does, but faster."""
+    def strptime_isoformat(value):
+        return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S').isoformat()
+
+    for value in ('2016-01-29T17:28:17', '2016-1-29T17:28:17',
+                  '2016-01-29T07:08:09'):
+        assert legacy_date_isoformat(value) == strptime_isoformat(value)
+    for value in ('2016-02-30T17:28:17', '2016-01-29 17:28:17', '2016-+1-29'
+                  'T17:28:17', '2016-01-29T17:28:17.5',
+                  '2016-01-29T17:28:17\n', '2016-\uff101-29T17:28:17'):
+        with pytest.raises(ValueError):
+            legacy_date_isoformat(value)
+
+    # timestamps shared by many items, served from the cache, see
+    # tests/benchmark_circulation.py for the timings
+    dates = ['2016-01-{0:02}T17:28:{1:02}'.format(
+        1 + i % 100 // 60, i % 100 % 60) for i in range(10000)]
+    legacy_date_isoformat.cache_clear()
+    assert [legacy_date_isoformat(d) for d in dates] == \
+        [strptime_isoformat(d) for d in dates]
+
+
+def test_rejection_log(tmpdir):
+    """Test writing the rejections in batches."""
+    filepath = tmpdir.join('rejected.jsonl')
+    with RejectionLog(str(filepath), batch_size=2) as rejections:
+        rejections.reject('barcode', id_bibrec=1)
+        assert not filepath.check()
+        rejections.reject('status', barcode='A', value='lost')
+        assert len(filepath.readlines()) == 2
+        rejections.reject('status', barcode='B', value='lost')
+    assert len(filepath.readlines()) == 3
+    assert rejections.counts == dict(barcode=1, status=2)
+
+    with RejectionLog(str(filepath)):
+        pass
+    assert filepath.read() == ''
+
+
+Base = declarative_base()
+
+
+class User(Base):
+    """Stand-in for the accounts users table."""
+
+    __tablename__ = 'user'
+    id = Column(Integer, primary_key=True)
+    email = Column(String)
+    active = Column(Integer)
+
+
+class UserIdentity(Base):
+    """Stand-in for the OAuth user identities table."""
+
+    __tablename__ = 'identity'
+    id = Column(String, primary_key=True)
+    method = Column(String, primary_key=True)
+    id_user = Column(Integer, ForeignKey('user.id'))
+
+
+class UserProfile(Base):
+    """Stand-in for the user profiles table."""
+
+    __tablename__ = 'profile'
+    user_id = Column(Integer, ForeignKey('user.id'), primary_key=True)
+    _displayname = Column(String)
+    full_name = Column(String)
+
+
+class RemoteAccount(Base):
+    """Stand-in for the OAuth remote accounts table."""
+
+    __tablename__ = 'remote_account'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('user.id'))
+    client_id = Column(String)
+    extra_data = Column(JSON)
+
+
+def test_bulk_import_users():
+    """Test inserting the users in batches."""
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    commits = []
+    session.commit = lambda commit=session.commit: commits.append(commit())
+    borrowers = (
+        dict(id=i, uid=str(i), email='user{0}@cern.ch'.format(i),
+             name='User {0}'.format(i), ccid=i * 10, department='IT')
+        for i in range(1, 6)
+    )
+
+    total = _bulk_import_users(
+        session, borrowers, (User, UserIdentity, UserProfile, RemoteAccount),
+        'client', batch_size=2)
+
+    assert total == 5
+    assert len(commits) == 3
+    assert session.query(User).count() == 5
+    assert session.query(UserIdentity).count() == 5
+    profile = session.query(UserProfile).filter_by(user_id=3).one()
+    assert profile._displayname == 'id_3'
+    assert profile.full_name == 'User 3'
+    account = session.query(RemoteAccount).filter_by(user_id=5).one()
+    assert account.client_id == 'client'
+    assert account.extra_data == {'person_id': 50, 'department': 'IT'}
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015-2018 CERN.
+#
+# cds-migrator-kit is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""CDS Migrator Records CLI tests."""
+
+import copy
+import json
+import os
+import re
+import signal
+
+import pytest
+
+from cds_migrator_kit.records import cli
+from cds_migrator_kit.records.cli import dryrun
+from cds_migrator_kit.records.index import TagIndex
+from cds_migrator_kit.records.log import JsonLogger
+from cds_migrator_kit.records.records import CDSRecordConverter
+
+
+@pytest.fixture()
+def cli_app(base_app, monkeypatch, tmpdir):
+    """Application writing the reports of the dry runs to a temporary dir."""
+    monkeypatch.setitem(base_app.config, 'CDS_MIGRATOR_KIT_LOGS_PATH',
+                        str(tmpdir.mkdir('logs')) + os.sep)
+    monkeypatch.setitem(base_app.config, 'CDS_MIGRATOR_KIT_CONVERSION_CACHE',
+                        None)
+    return base_app
+
+
+@pytest.fixture()
+def dump(datadir, tmpdir):
+    """Get a function writing dumps of copies of a legacy book.
+
+    The copies get the given recids, the ones in ``drop`` lose their 260
+    field.
+    """
+    with open(os.path.join(datadir, 'book1.json'), 'r') as f:
+        book = json.load(f)[0]
+
+    def write(name, recids, drop=()):
+        items = []
+        for recid in recids:
+            item = copy.deepcopy(book)
+            item['recid'] = recid
+            for revision in item['record']:
+                marcxml = revision['marcxml'].replace(
+                    '>262146<', '>{0}<'.format(recid))
+                if recid in drop:
+                    marcxml = re.sub(r'<datafield tag="260".*?</datafield>',
+                                     '', marcxml, flags=re.S)
+                revision['marcxml'] = marcxml
+            items.append(item)
+        filepath = str(tmpdir.join(name))
+        with open(filepath, 'w') as f:
+            json.dump(items, f)
+        return filepath
+    return write
+
+
+def _dryrun(app, *args):
+    """Run a dry run of documents, return its output."""
+    result = app.test_cli_runner().invoke(dryrun, args,
+                                          catch_exceptions=False)
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def _report(app, storage=None):
+    """Load the stats and records of the documents report."""
+    with app.app_context():
+        logger = JsonLogger.get_json_logger('document', storage=storage)
+        logger.load()
+    return ({str(key): stats for key, stats in logger.stats.items()},
+            {str(key): record for key, record in logger.records.items()})
+
+
+def test_dryrun_workers(cli_app, dump):
+    """Test converting records in worker processes."""
+    sources = [dump('books1.json', range(1, 6)),
+               dump('books2.json', range(6, 9), drop={7})]
+    _dryrun(cli_app, *sources)
+    serial = _report(cli_app)
+    assert sorted(serial[0], key=int) == [str(n) for n in range(1, 9)]
+
+    _dryrun(cli_app, '--workers', '2', *sources)
+    assert _report(cli_app) == serial
+    _dryrun(cli_app, '--workers', '2', '--per-file', *sources)
+    report = _report(cli_app)
+    assert report == serial
+    assert list(report[1]) == list(serial[1])
+
+
+def _fail(index, source):
+    """Fail to convert a dump."""
+    raise ValueError(source)
+
+
+def _die(index, source):
+    """Kill the worker process converting a dump."""
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+def test_dryrun_per_file_errors(cli_app, dump, monkeypatch):
+    """Test stopping when a worker converting a dump fails or dies."""
+    source = dump('books.json', [1])
+    monkeypatch.setattr(cli, '_convert_file', _fail)
+    with pytest.raises(ValueError):
+        _dryrun(cli_app, '--workers', '2', '--per-file', source)
+    monkeypatch.setattr(cli, '_convert_file', _die)
+    with pytest.raises(RuntimeError):
+        _dryrun(cli_app, '--workers', '2', '--per-file', source)
+
+
+def test_dryrun_resume(cli_app, dump):
+    """Test resuming a dry run interrupted while writing its report."""
+    source = dump('books.json', range(1, 6))
+    _dryrun(cli_app, '--storage', 'jsonl', source)
+    full = _report(cli_app, 'jsonl')
+
+    # interrupt the run while writing the stats of the third record
+    logs_path = cli_app.config['CDS_MIGRATOR_KIT_LOGS_PATH']
+    for filename in ('document_stats.jsonl', 'document_records.jsonl'):
+        with open(os.path.join(logs_path, filename), 'r+') as f:
+            lines = f.readlines()[:3]
+            lines[-1] = lines[-1][:10]
+            f.seek(0)
+            f.write(''.join(lines))
+            f.truncate()
+
+    output = _dryrun(cli_app, '--resume', source)
+    assert 'skipping 2 converted records' in output
+    assert 'Processing item 2...' not in output
+    assert 'Processing item 3...' in output
+    assert _report(cli_app, 'jsonl') == full
+
+
+def test_dryrun_resume_errors(cli_app, dump, monkeypatch):
+    """Test skipping the records failing with unexpected errors."""
+    convert = CDSRecordConverter.convert
+
+    def fail(self, data):
+        if data['recid'] == 2:
+            raise RuntimeError('unexpected')
+        return convert(self, data)
+
+    monkeypatch.setattr(CDSRecordConverter, 'convert', fail)
+    source = dump('books.json', range(1, 4))
+    output = _dryrun(cli_app, '--resume', source)
+    assert 'Skipping item 2...' in output
+    assert 'Processing item 2...' not in output
+    stats, records = _report(cli_app, 'jsonl')
+    assert sorted(stats) == ['1', '3']
+    with cli_app.app_context():
+        tags = TagIndex(JsonLogger.get_json_logger('document').TAGS_FILEPATH)
+        assert tags.recids(['245']) == {'1', '3'}
+        tags.close()
+
+    monkeypatch.setattr(CDSRecordConverter, 'convert', convert)
+    output = _dryrun(cli_app, '--resume', source)
+    assert 'skipping 2 converted records' in output
+    assert sorted(_report(cli_app, 'jsonl')[0]) == ['1', '2', '3']
+
+
+def test_dryrun_cache(cli_app, dump, monkeypatch, tmpdir):
+    """Test reusing the records converted by a previous dry run."""
+    monkeypatch.setitem(cli_app.config, 'CDS_MIGRATOR_KIT_CONVERSION_CACHE',
+                        str(tmpdir.join('cache.sqlite')))
+    converted = []
+    convert = CDSRecordConverter.convert
+
+    def count(self, data):
+        converted.append(data['recid'])
+        return convert(self, data)
+
+    monkeypatch.setattr(CDSRecordConverter, 'convert', count)
+    source = dump('books.json', range(1, 4))
+    _dryrun(cli_app, source)
+    report = _report(cli_app)
+    assert converted == [1, 2, 3]
+
+    _dryrun(cli_app, source)
+    assert converted == [1, 2, 3]
+    assert _report(cli_app) == report
+    _dryrun(cli_app, '--no-cache', source)
+    assert converted == [1, 2, 3] * 2
+
+
+def test_dryrun_only_tags(cli_app, dump):
+    """Test converting again the records of some dumps having a tag."""
+    sources = [dump('books1.json', [1, 2], drop={2}),
+               dump('books2.json', [3])]
+    _dryrun(cli_app, *sources)
+    report = _report(cli_app)
+
+    output = _dryrun(cli_app, '--only-tags', '260', sources[0])
+    assert 'Converting again 1 records' in output
+    assert 'Processing item 1...' in output
+    assert 'Processing item 3...' not in output
+    assert _report(cli_app) == report
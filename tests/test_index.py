@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015-2018 CERN.
+#
+# cds-migrator-kit is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""CDS Migrator Records report index tests."""
+
+import json
+import os
+
+import pytest
+
+from cds_migrator_kit.records.index import LRUCache, ReportCache, \
+    ReportIndex, TagIndex
+from cds_migrator_kit.records.log import DocumentJsonLogger
+
+
+def test_report_index(tmpdir):
+    """Test paginating stats and getting records from the index."""
+    index = ReportIndex(str(tmpdir.join('document_stats.sqlite')))
+    stats = [(recid, {'recid': recid, 'clean': recid % 2 == 0})
+             for recid in (3, 1, 2)]
+    records = [(1, {'recid': 1}), ('1-doc-1', {'volume': '1'})]
+    index.build(stats, records)
+
+    assert index.count() == 3
+    assert index.page(1, 2) == [{'recid': 1, 'clean': False},
+                                {'recid': 2, 'clean': True}]
+    assert index.page(2, 2) == [{'recid': 3, 'clean': False}]
+    assert index.page(3, 2) == []
+
+    assert index.records[1] == {'recid': 1}
+    assert index.records['1-doc-1']['volume'] == '1'
+    assert '2' not in index.records
+    with pytest.raises(KeyError):
+        index.records['2']
+
+    index.build(stats[:1], [])
+    assert index.count() == 1
+    assert index.records.get(1) is None
+
+
+def test_lru_cache():
+    """Test evicting the least recently used items."""
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert len(cache) == 2
+
+
+def test_report_cache(base_app):
+    """Test reusing report indexes until the report is rewritten."""
+    cache = ReportCache(maxsize=10)
+    with base_app.app_context():
+        logger = DocumentJsonLogger()
+        logger.add_recid_to_stats(1)
+        logger.add_record({'recid': 1, 'title': 'first'})
+        logger.save()
+
+        index = cache.index(logger)
+        assert index.records['1']['title'] == 'first'
+        assert cache.index(logger) is index
+        assert len(cache.data) == 1
+
+        logger.records[1]['title'] = 'second'
+        logger.save()
+        new_index = cache.index(logger)
+        assert new_index is not index
+        assert new_index.records['1']['title'] == 'second'
+
+        # a report saved in another storage than the one of the config
+        logger = DocumentJsonLogger(storage='jsonl')
+        logger.add_recid_to_stats(1)
+        logger.add_record({'recid': 1, 'title': 'third'})
+        logger.save()
+        index = cache.index(DocumentJsonLogger())
+        assert index.records['1']['title'] == 'third'
+        assert ReportIndex.for_logger(
+            DocumentJsonLogger()).records['1']['title'] == 'third'
+
+
+def test_report_index_missing(base_app):
+    """Test building an index missing from its report, if any."""
+    with base_app.app_context():
+        logger = DocumentJsonLogger()
+        logger.add_recid_to_stats(1)
+        logger.add_record({'recid': 1})
+        logger.save()
+        os.remove(logger.INDEX_FILEPATH)
+        assert ReportIndex.for_logger(logger).records['1'] == {'recid': 1}
+
+        for filepath in (logger.INDEX_FILEPATH, logger.STAT_FILEPATH,
+                         logger.RECORD_FILEPATH):
+            os.remove(filepath)
+        with pytest.raises(FileNotFoundError):
+            ReportCache(maxsize=10).index(logger)
+
+
+def test_report_index_errors(tmpdir):
+    """Test filtering and counting the errors of the stats."""
+    index = ReportIndex(str(tmpdir.join('document_stats.sqlite')))
+    error = dict(key='020__', subfield='a', value='x', message='Wrong ISBN')
+    stats = [
+        (1, {'recid': 1, 'clean': True, 'lost_data': [],
+             'unexpected_value': []}),
+        (2, {'recid': 2, 'clean': False,
+             'lost_data': [{'missing': ['020__', '260__'], 'message': ''}],
+             'unexpected_value': [error, 'Model definition missing']}),
+        (3, {'recid': 3, 'clean': False, 'lost_data': [],
+             'unexpected_value': [dict(error, value='y')]}),
+    ]
+    index.build(stats, [])
+
+    assert index.dirty() == ['2', '3']
+    hits = index.errors(category='unexpected_value', key='020__',
+                        subfield='a')
+    assert [(hit['recid'], hit['value']) for hit in hits] == [
+        ('2', 'x'), ('3', 'y')]
+    assert [hit['recid'] for hit in index.errors(key='260__')] == ['2']
+    assert index.errors(category='lost_data', key='020__', page=2,
+                        size=1) == []
+
+    assert index.count_errors(category='unexpected_value') == [
+        dict(key='020__', count=2, records=2),
+        dict(key=None, count=1, records=1),
+    ]
+    assert index.count_errors(by_subfield=True)[0] == dict(
+        key='020__', subfield='a', count=2, records=2)
+
+
+def test_report_index_export(tmpdir):
+    """Test exporting records as JSON Lines in chunks."""
+    index = ReportIndex(str(tmpdir.join('multipart_stats.sqlite')))
+    stats = [(recid, {'recid': recid, 'clean': recid != 2})
+             for recid in (1, 2, 10)]
+    records = [(10, {'recid': 10}), (2, {'recid': 2}),
+               ('2-doc-1', {'recid': '2-doc-1'}), (1, {'recid': 1})]
+    index.build(stats, records)
+
+    def export(**kwargs):
+        return [json.loads(line)['recid']
+                for chunk in index.export(chunk_size=2, **kwargs)
+                for line in chunk.splitlines()]
+
+    assert export() == [1, 2, '2-doc-1', 10]
+    assert len(list(index.export(chunk_size=2))) == 2
+    assert export(start=2, end=9) == [2, '2-doc-1']
+    assert export(clean=False) == [2, '2-doc-1']
+    assert export(clean=True, start=5) == [10]
+
+
+def test_tag_index(tmpdir):
+    """Test finding the records having some MARC tags."""
+    tags = TagIndex(str(tmpdir.join('document_stats_tags.sqlite')),
+                    batch_size=2)
+    with pytest.raises(FileNotFoundError):
+        tags.recids(['260'])
+
+    def item(marcxml):
+        return {'recid': 1, 'record': [{'marcxml': '<record/>'},
+                                       {'marcxml': marcxml}]}
+
+    assert TagIndex.record_tags(item(
+        '<record><controlfield tag="001">1</controlfield>'
+        '<datafield tag="260" ind1=" " ind2=" "></datafield>'
+        '<datafield tag=\'020\'></datafield><datafield tag="260">'
+        '</datafield></record>')) == ['001', '020', '260']
+    assert TagIndex.record_tags({'recid': 1, 'record': [{}]}) == []
+
+    tags.add(1, ['001', '260'])
+    assert not os.path.exists(tags.filepath)
+    tags.add(2, ['020'])
+    assert tags.recids(['260']) == {'1'}
+    assert tags.recids(['260', '020']) == {'1', '2'}
+
+    tags.add(1, ['020'])
+    tags.flush()
+    assert tags.recids(['260']) == set()
+    assert tags.recids(['020']) == {'1', '2'}
+    tags.add(3, ['260'])
+    tags.close()
+    tags = TagIndex(tags.filepath)
+    assert tags.recids(['260']) == {'3'}
+    tags.close()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015-2018 CERN.
+#
+# cds-migrator-kit is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""CDS Migrator Records loggers tests."""
+
+from cds_migrator_kit.records.log import DocumentJsonLogger, \
+    MultipartJsonLogger, SerialJsonLogger
+from cds_migrator_kit.records.storage import JsonLinesStorage
+from cds_migrator_kit.records.utils import compare_titles, same_issn
+
+
+def test_merge_stats(base_app):
+    """Test merging stats collected by a worker logger."""
+    with base_app.app_context():
+        worker = DocumentJsonLogger()
+        worker.add_recid_to_stats(1)
+        worker.stats[1]['clean'] = False
+        worker.stats[1]['lost_data'].append({'missing': ['020__a']})
+
+        logger = DocumentJsonLogger()
+        logger.merge_stats(1, worker.stats[1])
+        logger.merge_stats(2, None)
+        assert logger.stats == {1: worker.stats[1]}
+
+        logger.merge_stats(1, dict(worker.stats[1], lost_data=[{}]))
+        assert logger.stats[1]['lost_data'] == [{'missing': ['020__a']}, {}]
+        assert logger.stats[1]['clean'] is False
+
+
+def test_discard(base_app):
+    """Test removing the loaded entries of records converted again."""
+    with base_app.app_context():
+        logger = DocumentJsonLogger()
+        logger.stats = {'1': {'recid': 1}, '2': {'recid': 2}}
+        logger.records = {'1': {'recid': 1}, '2': {'recid': 2}}
+        logger.discard({'1'})
+        assert list(logger.stats) == ['2'] and list(logger.records) == ['2']
+
+        logger = MultipartJsonLogger()
+        logger.stats = {'1': {'volumes': ['1-doc-1', '1-doc-2']},
+                        '2': {'volumes': ['2-doc-3']}}
+        logger.records = {'1': {}, '1-doc-1': {}, '1-doc-2': {},
+                          '2': {}, '2-doc-3': {}}
+        logger.discard({'1'})
+        assert list(logger.records) == ['2', '2-doc-3']
+        assert logger.next_doc_pid() == 4
+
+
+def test_json_lines_storage(tmpdir):
+    """Test appending stats and records to JSON Lines files."""
+    storage = JsonLinesStorage(str(tmpdir.join('document_stats.json')),
+                               str(tmpdir.join('document_records.json')))
+    assert storage.stats_filepath.endswith('document_stats.jsonl')
+    assert not storage.exists()
+
+    storage.append({1: {'recid': 1, 'clean': True}}, {1: {'recid': 1}})
+    # appended lines are readable before the report is saved
+    assert storage.load() == ({'1': {'recid': 1, 'clean': True}},
+                              {'1': {'recid': 1}})
+
+    storage.save({1: {'recid': 1, 'clean': False}, 2: {'recid': 2}}, {})
+    stats, records = storage.load()
+    assert stats == {'1': {'recid': 1, 'clean': False}, '2': {'recid': 2}}
+    assert records == {'1': {'recid': 1}}
+
+    with open(storage.stats_filepath, 'a') as f:
+        f.write('[3, {"recid"')
+    assert '3' not in storage.load()[0]
+
+
+def test_json_lines_storage_resume(tmpdir):
+    """Test resuming an interrupted JSON Lines report."""
+    storage = JsonLinesStorage(str(tmpdir.join('document_stats.json')),
+                               str(tmpdir.join('document_records.json')))
+    assert storage.resume() == set()
+    storage.append({1: {'recid': 1}}, {1: {'recid': 1}})
+    with open(storage.records_filepath, 'a') as f:
+        f.write('[2, {"recid"')
+
+    storage = JsonLinesStorage(str(tmpdir.join('document_stats.json')),
+                               str(tmpdir.join('document_records.json')))
+    assert storage.resume() == {'1'}
+    storage.save({2: {'recid': 2}}, {2: {'recid': 2}})
+    assert storage.load() == ({'1': {'recid': 1}, '2': {'recid': 2}},
+                              {'1': {'recid': 1}, '2': {'recid': 2}})
+
+
+def test_resume_json_report(base_app):
+    """Test resuming a report only written once saved."""
+    with base_app.app_context():
+        logger = DocumentJsonLogger(storage='json')
+        assert not hasattr(logger.storage, 'append')
+        assert logger.resume() == set()
+
+
+def test_match_similar_serials(base_app):
+    """Test matching similar serials, serially and in worker processes."""
+    serials = [
+        ('Journal of Physics', '1234-5678'), ('Journal of Physic', None),
+        ('Journal of Physics A', '1234-5678'), ('Nuclear Physics', None),
+        ('Nuclear Physic', '1111-2222'), ('Nuclear Physics B', '1111-2222'),
+        ('Physical Review Letters', None), ('Physical Review Letter', None),
+    ]
+    expected = {}
+    for title1, issn1 in serials:
+        similars = expected[title1] = {'same_issn': [], 'similar_title': []}
+        for title2, issn2 in serials:
+            if title1 == title2:
+                continue
+            if same_issn({'issn': issn1}, {'issn': issn2}):
+                similars['same_issn'].append(title2)
+            elif 95 <= compare_titles(title1, title2) < 100:
+                similars['similar_title'].append(title2)
+
+    with base_app.app_context():
+        for workers in (1, 2):
+            logger = SerialJsonLogger(workers=workers)
+            for recid, (title, issn) in enumerate(serials):
+                logger._add_to_stats(
+                    {'recid': recid, 'title': {'title': title}, 'issn': issn})
+            logger._match_similar()
+            assert {title: stats['similars']
+                    for title, stats in logger.stats.items()} == expected
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015-2018 CERN.
+#
+# cds-migrator-kit is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""CDS Migrator Records MARCXML parsers tests."""
+
+from glob import glob
+from os.path import join
+
+from cds_dojson.marc21.utils import create_record
+from cds_dojson.utils import not_accessed_keys
+from tests.helpers import load_json
+
+from cds_migrator_kit.records.log import DocumentJsonLogger
+from cds_migrator_kit.records.marcxml import MarcXMLParser, get_marcxml_parser
+from cds_migrator_kit.records.records import CDSRecordConverter
+
+
+def _corpus(datadir):
+    """Get the MARCXML of all the revisions of the test dumps.
+
+    Variants of each revision (namespaced, with empty, repeated and
+    indicator-less fields) are added to cover more of the structure.
+    """
+    for filepath in sorted(glob(join(datadir, '*.json'))):
+        for item in load_json(datadir, filepath):
+            for revision in item['record']:
+                marcxml = revision['marcxml']
+                yield marcxml
+                yield marcxml.replace(
+                    '<record>',
+                    '<record xmlns="http://www.loc.gov/MARC21/slim">', 1)
+                yield marcxml.replace(
+                    '</record>',
+                    '<leader>00000nam</leader>'
+                    '<controlfield tag="008"></controlfield>'
+                    '<datafield tag="700" ind1="1" ind2="">'
+                    '<subfield code="a"></subfield>'
+                    '<subfield code="a">Doe, Jérôme</subfield>'
+                    '</datafield>'
+                    '<datafield tag="999" ind1=" " ind2=" "></datafield>'
+                    '<datafield tag="500"><subfield code="a">x</subfield>'
+                    '</datafield>'
+                    '<datafield tag="501" ind2="#"><subfield code="a">y'
+                    '</subfield></datafield>'
+                    '</record>', 1)
+
+
+def test_marcxml_parser(datadir):
+    """Test parsing MARCXML as ``create_record`` does."""
+    parser = MarcXMLParser()
+    for marcxml in _corpus(datadir):
+        expected = create_record(marcxml)
+        result = parser(marcxml)
+        # before the items are read, which marks them as accessed
+        assert not_accessed_keys(result) == not_accessed_keys(expected)
+        assert list(result.items()) == list(expected.items())
+        assert result == expected
+
+
+def _parse(parse, marcxml):
+    """Parse MARCXML, or get the type of the error."""
+    try:
+        return list(parse(marcxml).items())
+    except Exception as e:
+        return type(e)
+
+
+def test_marcxml_parser_invalid():
+    """Test parsing invalid MARCXML as ``create_record`` does."""
+    parser = MarcXMLParser()
+    record = '<record><controlfield tag="001">\u00e9</controlfield></record>'
+    for marcxml in ('', 'not xml', '<record', record[:-9], record,
+                    record.encode('utf-8'), '<!-- x -->' + record,
+                    '<?xml version="1.0"?>' + record,
+                    '<?xml version="1.0" encoding="ISO-8859-1"?>' + record,
+                    '<?xml version="1.0" encoding="UTF-8"?>' + record):
+        assert _parse(parser, marcxml) == _parse(create_record, marcxml)
+
+
+def _convert(converter, item):
+    """Convert a record, with the type and missing fields of the error.
+
+    :returns: the record or error and the stats logged for the record.
+    """
+    logger = converter.logger
+    logger.add_recid_to_stats(item['recid'])
+    try:
+        result = converter.convert(item)
+    except Exception as e:
+        result = type(e), getattr(e, 'missing', None)
+    return result, logger.stats.pop(item['recid'])
+
+
+def test_convert_with_marcxml_parser(datadir, base_app):
+    """Test converting records with the lxml parser."""
+    with base_app.app_context():
+        default = CDSRecordConverter(logger=DocumentJsonLogger())
+        fast = CDSRecordConverter(logger=DocumentJsonLogger(),
+                                  parse_marcxml=get_marcxml_parser('lxml'))
+        for filename in ('book1.json', 'books.json', 'marcxml_corpus.json'):
+            for item in load_json(datadir, filename):
+                assert _convert(fast, item) == _convert(default, item)
@@ -10,7 +10,7 @@
 
 from tests.helpers import load_json
 
-from cds_migrator_kit.records.records import CDSRecordDump
+from cds_migrator_kit.records.records import CDSRecordConverter, CDSRecordDump
 
 
 def test_migrate_record(datadir, base_app):
@@ -107,3 +107,17 @@ def test_migrate_record(datadir, base_app):
                            'volumes': []},
 
         }
+
+
+def test_record_converter(datadir, base_app):
+    """Test converting many records with the same converter."""
+    with base_app.app_context():
+        data = load_json(datadir, 'book1.json')
+        dump = CDSRecordDump(data=data[0])
+        dump.prepare_revisions()
+        converter = CDSRecordConverter()
+        handlers = converter.exception_handlers
+
+        for item in load_json(datadir, 'book1.json') * 2:
+            assert converter.convert(item) == dump.revisions[-1][1]
+        assert converter.exception_handlers is handlers
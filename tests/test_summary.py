@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015-2018 CERN.
+#
+# cds-migrator-kit is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""CDS Migrator Records report summary tests."""
+
+import json
+
+from cds_migrator_kit.records.log import DocumentJsonLogger
+from cds_migrator_kit.records.summary import normalize_message, summarize
+
+
+def test_normalize_message():
+    """Test normalizing error messages."""
+    assert normalize_message('Lossy conversion: {"020__"}') == \
+        'Lossy conversion'
+    assert normalize_message('Volume 12 of 3 ') == 'Volume # of #'
+    assert normalize_message(None) == ''
+
+
+def test_summarize():
+    """Test summarizing the errors of stats entries."""
+    error = dict(key='020__', subfield='a', value='x', message='Wrong ISBN')
+    stats = [
+        (1, {'recid': 1, 'clean': True, 'lost_data': []}),
+        (2, {'recid': 2, 'clean': False,
+             'lost_data': [{'missing': ['260__'],
+                            'message': 'Lossy conversion: 260__'}],
+             'unexpected_value': [error, error]}),
+        (3, {'recid': 3, 'clean': False,
+             'unexpected_value': [dict(error, value='y')]}),
+    ]
+    summary = summarize(stats, top=1)
+
+    assert summary['records'] == 3
+    assert summary['clean'] == 1
+    assert summary['categories']['unexpected_value'] == dict(
+        errors=3, records=2)
+    assert summary['categories']['lost_data'] == dict(errors=1, records=1)
+    assert summary['fields'][0] == dict(
+        category='unexpected_value', key='020__', subfield='a', count=3)
+    assert dict(category='lost_data', message='Lossy conversion',
+                count=1) in summary['messages']
+    assert summary['values'] == [dict(
+        category='unexpected_value', key='020__', subfield='a', value='x',
+        count=2)]
+
+
+def test_save_summary(base_app):
+    """Test summarizing a report once per record, as in its index."""
+    with base_app.app_context():
+        logger = DocumentJsonLogger(storage='jsonl')
+        # a record converted twice, f.e. read from two dumps
+        logger.add_recid_to_stats(1)
+        logger.flush()
+        logger.add_recid_to_stats(1)
+        logger.stats[1]['clean'] = False
+        logger.add_recid_to_stats(2)
+        logger.save()
+
+        with open(logger.SUMMARY_FILEPATH) as f:
+            summary = json.load(f)
+        assert summary['records'] == 2
+        assert summary['clean'] == 1
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015-2018 CERN.
+#
+# cds-migrator-kit is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""CDS Migrator Records utils tests."""
+
+import gzip
+import io
+import json
+from os.path import join
+
+import pytest
+
+from cds_migrator_kit.records.utils import AccessCache, compare_titles, \
+    compare_titles_bulk, iter_json_array, open_dump, process_fireroles, \
+    similar_title_pairs
+
+
+def test_iter_json_array(datadir):
+    """Test streaming the items of a JSON array."""
+    with open(join(datadir, 'book1.json'), 'r') as fp:
+        expected = json.load(fp)
+    with open(join(datadir, 'book1.json'), 'r') as fp:
+        assert list(iter_json_array(fp, chunk_size=16)) == expected
+
+    data = [{'recid': 1}, 12.5e3, 'a],"b', [], None]
+    for chunk_size in (1, 2, 7, 1024):
+        stream = io.StringIO(json.dumps(data, indent=2))
+        assert list(iter_json_array(stream, chunk_size)) == data
+
+    assert list(iter_json_array(io.StringIO(' [ ] '))) == []
+
+
+def test_iter_json_array_invalid():
+    """Test streaming invalid JSON arrays."""
+    for content in ('', '{}', '[1 2]', '[{"recid": 1},'):
+        with pytest.raises(ValueError):
+            list(iter_json_array(io.StringIO(content), chunk_size=2))
+
+
+def test_open_dump(tmpdir):
+    """Test reading plain and compressed dumps without rewriting them."""
+    content = '[{"title": "Caf\u00e9 \u00e9 '.encode('utf-8') + \
+        b'\xff"}]'
+    plain = tmpdir.join('dump.json')
+    plain.write_binary(content)
+    compressed = tmpdir.join('dump.json.gz')
+    compressed.write_binary(gzip.compress(content))
+
+    for dump in (plain, compressed):
+        with open_dump(str(dump)) as fp:
+            assert list(iter_json_array(fp)) == [
+                {'title': 'Caf\u00e9 \u00e9 \ufffd'}]
+    assert plain.read_binary() == content
+
+
+def test_similar_title_pairs():
+    """Test that candidate pairs include all the similar titles."""
+    titles = [
+        'Journal of Physics', 'Journal of Physics A', 'Journal of Physic',
+        'Physical Review Letters', 'Physical Review Letter',
+        'Physical review letters', 'Lecture notes in physics',
+        'Lecture notes in physics.', 'CERN Yellow Reports', 'a', 'ab', '',
+        'Nuclear Instruments and Methods in Physics Research',
+        'Nuclear Instruments and Methods in Physics Research A',
+        'Nuclear Instruments & Methods in Physics Research',
+    ]
+    similar = {
+        (i, j)
+        for i in range(len(titles)) for j in range(i + 1, len(titles))
+        if 95 <= compare_titles(titles[i], titles[j]) < 100
+    }
+    assert similar
+    pairs = similar_title_pairs(titles)
+    assert similar <= pairs
+    assert len(pairs) < len(titles) * (len(titles) - 1) / 2
+
+
+def test_compare_titles_bulk():
+    """Test comparing a title with many titles at once."""
+    titles = ['Journal of Physics', 'Journal of Physics A', '', 'physics',
+              'Journal of Physic', 'x' * 100 + 'y', 'x' * 101]
+    for title in titles:
+        assert compare_titles_bulk(title, titles) == [
+            compare_titles(title, other) for other in titles]
+    assert compare_titles_bulk('Journal of Physics', []) == []
+
+
+def test_compare_titles_bulk_halfway():
+    """Test rounding the ratios halfway between integers as one by one."""
+    # ratios of 42.5 and, at the similarity threshold, 94.5
+    title = 'of Nuclear Theoretical Annals Physics Reports'
+    other = 'in A Letters Physics Nuclear Annals'
+    assert compare_titles_bulk(title, [other]) == [
+        compare_titles(title, other)]
+    titles = ['x' * 189 + 'y' * 11, 'x' * 200]
+    assert compare_titles_bulk('x' * 200, titles) == [
+        compare_titles('x' * 200, other) for other in titles]
+
+
+def test_access_cache(base_app):
+    """Test memoizing the access of restricted collections."""
+    fireroles = [[None, [
+        (True, False, 'group', [(False, 'Theory Group [CERN]')]),
+        (False, False, 'group', [(False, 'Guests [CERN]')]),
+    ]]]
+    restricted = {'THESIS': {'users': ['jane@cern.ch', None],
+                             'fireroles': fireroles}}
+    expected = {'jane@cern.ch', 'theory-group@cern.ch'}
+    with base_app.app_context():
+        cache = AccessCache()
+        assert cache.read_access(restricted) == expected
+        assert cache.read_access(dict(restricted)) == expected
+        assert len(cache._access) == 1
+        assert process_fireroles(fireroles) == {'theory-group@cern.ch'}
+
+    message = "Not possible to migrate deny rules: [(False, 'Guests [CERN]')]."
+    assert cache.warnings == {message: 2}
+    assert cache.pop_warnings() == {message: 2}
+    assert not cache.warnings
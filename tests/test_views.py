@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015-2018 CERN.
+#
+# cds-migrator-kit is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""CDS Migrator Records views tests."""
+
+import json
+
+from cds_migrator_kit.records.log import DocumentJsonLogger
+
+
+def test_results_views(base_app):
+    """Test the paginated results views."""
+    with base_app.app_context():
+        logger = DocumentJsonLogger()
+        for recid in (1, 2, 3):
+            logger.add_recid_to_stats(recid)
+            logger.add_record({'recid': recid})
+        logger.save()
+
+    with base_app.test_client() as client:
+        res = client.get('/results/document?page=2&size=2')
+        assert res.status_code == 200
+        assert b'/record/document/3' in res.data
+        assert b'/record/document/1' not in res.data
+
+        res = client.get('/stats/document?page=1&size=2')
+        assert res.json['total'] == 3
+        assert [hit['recid'] for hit in res.json['hits']] == [1, 2]
+
+        assert client.get('/record/document/2').json == {'recid': 2}
+        assert client.get('/record/document/4').status_code == 404
+
+
+def test_errors_views(base_app):
+    """Test filtering and counting the errors of the stats."""
+    with base_app.app_context():
+        logger = DocumentJsonLogger()
+        for recid in (1, 2):
+            logger.add_recid_to_stats(recid)
+        logger.stats[2]['clean'] = False
+        logger.stats[2]['manual_migration'].append(dict(
+            key='020__', subfield='a', value='x', message='Check ISBN'))
+        logger.save()
+
+    with base_app.test_client() as client:
+        res = client.get('/stats/document/errors?category=manual_migration'
+                         '&key=020__&subfield=a')
+        assert [hit['recid'] for hit in res.json['hits']] == ['2']
+        res = client.get('/stats/document/errors/count')
+        assert res.json['hits'] == [dict(key='020__', count=1, records=1)]
+        assert client.get('/stats/document/dirty').json['hits'] == ['2']
+        res = client.get('/stats/document/errors?category=unknown')
+        assert res.status_code == 400
+
+
+def test_export_view(base_app):
+    """Test streaming the records as JSON Lines."""
+    with base_app.app_context():
+        logger = DocumentJsonLogger()
+        for recid in (1, 2, 3):
+            logger.add_recid_to_stats(recid)
+            logger.add_record({'recid': recid})
+        logger.stats[2]['clean'] = False
+        logger.save()
+
+    with base_app.test_client() as client:
+        res = client.get('/export/document?start=2')
+        assert res.mimetype == 'application/x-ndjson'
+        assert res.data.splitlines() == [b'{"recid": 2}', b'{"recid": 3}']
+        res = client.get('/export/document?status=clean')
+        assert res.data.splitlines() == [b'{"recid": 1}', b'{"recid": 3}']
+        assert client.get('/export/document?status=x').status_code == 400
+
+
+def test_views_reload_report(base_app):
+    """Test reloading a report whose files were rewritten."""
+    with base_app.app_context():
+        logger = DocumentJsonLogger()
+        for recid in (1, 2):
+            logger.add_recid_to_stats(recid)
+        logger.save()
+
+    with base_app.test_client() as client:
+        res = client.get('/stats/document?page=1&size=10')
+        assert res.json['total'] == 2
+
+        # f.e. a report copied over, without its index
+        with open(logger.STAT_FILEPATH, 'w') as f:
+            json.dump({'3': {'recid': 3, 'clean': True}}, f)
+        res = client.get('/stats/document?page=1&size=10')
+        assert [hit['recid'] for hit in res.json['hits']] == [3]